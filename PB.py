@@ -1,10 +1,21 @@
 import simpy
 import random
+import sys
+from latency import service_time, percentile, saturation_sweep
 
 # Constants
 NUM_NODES = 100
 NUM_REPLICA_GROUPS = 10
 NUM_CLIENT_REQUESTS = 10000
+ARRIVAL_RATE = 1.0  # Client requests per ms (open loop)
+MIN_HOP_DELAY = 0.5  # ms per network hop
+MAX_HOP_DELAY = 1.0
+PRIMARY_SERVICE_TIME = 0.5  # Mean ms the primary spends executing a request
+BACKUP_SERVICE_TIME = 0.2  # Mean ms a backup spends applying an update
+NODE_CONCURRENCY = 1  # Requests a node works on at once; the rest queue
+SWEEP_REQUESTS = 5000
+HEARTBEAT_INTERVAL = 1.0  # ms between primary heartbeats, each renewing its lease
+LEASE_DURATION = 3.0  # ms a lease stays valid; backups suspect the primary once it lapses
 
 class PrimaryBackup:
     def __init__(self, sim, node_id, replica_group):
@@ -15,6 +26,9 @@ class PrimaryBackup:
         self.primary = False
         self.requests_handled = 0
         self.failed = False
+        self.recovered_at = 0
+        self.heartbeat_phase = random.uniform(0, HEARTBEAT_INTERVAL)  # Heartbeats go out at phase + k * interval
+        self.server = simpy.Resource(sim.env, capacity=NODE_CONCURRENCY)
 
         self.sim.env.process(self.replica_process())
         self.sim.env.process(self.primary_process())
@@ -36,10 +50,11 @@ class PrimaryBackup:
                 yield self.sim.env.timeout(wait_time)
 
                 if random.random() < 0.8:
-                    request_latency = random.uniform(1, 10)
-                    request_start = int(self.sim.env.now)
-                    yield self.sim.env.timeout(request_latency)
-                    self.sim.total_latency[request_start] += self.sim.env.now - request_start
+                    request_start = self.sim.env.now
+                    with self.server.request() as request:
+                        yield request
+                        yield self.sim.env.timeout(service_time(PRIMARY_SERVICE_TIME))
+                    self.sim.total_latency += self.sim.env.now - request_start
                     self.requests_handled += 1
 
             yield self.sim.env.timeout(random.uniform(0.5, 1.5))
@@ -48,78 +63,206 @@ class PrimaryBackup:
         self.replicas = [node for node in nodes if node.replica_group == self.replica_group and node != self]
 
 class Simulator:
-    def __init__(self, env):
+    def __init__(self, env, arrival_rate=ARRIVAL_RATE, failures=True, num_requests=NUM_CLIENT_REQUESTS):
         self.env = env
+        self.arrival_rate = arrival_rate
+        self.num_requests = num_requests
+        self.failures = failures
         self.nodes = []
-        self.total_latency = [0] * (NUM_CLIENT_REQUESTS * 2)
+        self.total_latency = 0
+        self.request_latencies = []
         self.total_network_overhead = 0
         self.total_requests = 0
         self.successful_requests = 0
+        self.primaries = [None] * NUM_REPLICA_GROUPS  # Current primary per replica group
+        self.live_replicas = [{} for _ in range(NUM_REPLICA_GROUPS)]  # Insertion-ordered live members per group
+        self.recovery_events = [None] * NUM_REPLICA_GROUPS  # Elections waiting for any member to come back
+        self.unavailable_since = [None] * NUM_REPLICA_GROUPS  # Primary failure not yet failed over
+        self.failovers = []  # (group, failed_at, detected_at, elected_at)
+        self.lease_blips = []  # (group, failed_at, recovered_at) for primaries back before their lease lapsed
 
         for i in range(NUM_NODES):
             replica_group = i % NUM_REPLICA_GROUPS
             node = PrimaryBackup(self, i, replica_group)
             self.nodes.append(node)
+            self.live_replicas[replica_group][node] = None
 
             # Elect initial primaries for each replica group
-            if not any(n.primary for n in self.nodes if n.replica_group == replica_group):
+            if self.primaries[replica_group] is None:
                 node.primary = True
+                self.primaries[replica_group] = node
 
             node.set_replicas(self.nodes)
 
-    def run(self):
-        for i in range(NUM_CLIENT_REQUESTS):
-            self.total_requests += 1
-            client = random.choice(self.nodes)
-            primaries = [n for n in client.replicas if n.primary and not n.failed]
-            if primaries:
-                primary = random.choice(primaries)
-                request_latency = random.uniform(1, 10)
-                request_start = int(self.env.now)
-                yield self.env.timeout(request_latency)
-                self.total_latency[request_start] += self.env.now - request_start
-                self.successful_requests += 1
-
-        for _ in range(NUM_CLIENT_REQUESTS):
+    def hop(self):
+        return self.env.timeout(random.uniform(MIN_HOP_DELAY, MAX_HOP_DELAY))
+
+    def handle_request(self, client):
+        primary = self.primaries[client.replica_group]
+        if primary is None or primary.failed:
+            return  # No primary until the election finishes
+        request_start = self.env.now
+        yield self.hop()
+        with primary.server.request() as request:
+            yield request
+            yield self.env.timeout(service_time(PRIMARY_SERVICE_TIME))
+
+        # The primary answers once every live backup has applied the update
+        backups = [r for r in self.live_replicas[primary.replica_group] if r is not primary]
+        yield self.env.all_of([self.env.process(self.replicate(backup)) for backup in backups])
+        yield self.hop()
+        latency = self.env.now - request_start
+        self.total_latency += latency
+        self.request_latencies.append(latency)
+        self.successful_requests += 1
+
+    def replicate(self, backup):
+        yield self.hop()
+        with backup.server.request() as request:
+            yield request
+            yield self.env.timeout(service_time(BACKUP_SERVICE_TIME))
+        yield self.hop()
+
+    def fail(self, node):
+        node.failed = True
+        group = node.replica_group
+        del self.live_replicas[group][node]
+        if self.primaries[group] is node and self.unavailable_since[group] is None:
+            self.unavailable_since[group] = self.env.now
+            self.env.process(self.failover(node))
+
+    def recover(self, node):
+        node.failed = False
+        node.recovered_at = self.env.now
+        group = node.replica_group
+        self.live_replicas[group][node] = None
+        waiting = self.recovery_events[group]
+        if waiting is not None:
+            self.recovery_events[group] = None
+            waiting.succeed()
+
+    def failover(self, primary):
+        group = primary.replica_group
+        failed_at = self.env.now
+        # The primary last renewed its lease at the heartbeat before it failed; backups suspect it once that lease lapses
+        last_heartbeat = failed_at - (failed_at - primary.heartbeat_phase) % HEARTBEAT_INTERVAL
+        yield self.env.timeout(last_heartbeat + LEASE_DURATION - failed_at)
+        detected_at = self.env.now
+        if not primary.failed:
+            # Back up while its lease still held, so it keeps the role without an election
+            self.lease_blips.append((group, failed_at, primary.recovered_at))
+            self.unavailable_since[group] = None
+            return
+
+        # Its lease has lapsed, so it is deposed even if it comes back before the election ends
+        primary.primary = False
+        self.primaries[group] = None
+        while True:
+            if not self.live_replicas[group]:
+                self.recovery_events[group] = self.env.event()
+                yield self.recovery_events[group]
+            candidate = next(iter(self.live_replicas[group]))
+            # One round of votes from the group before the candidate takes over
+            yield self.hop()
+            yield self.hop()
+            if not candidate.failed:
+                break
+
+        candidate.primary = True
+        candidate.heartbeat_phase = self.env.now % HEARTBEAT_INTERVAL  # Starts heartbeating once elected
+        self.primaries[group] = candidate
+        self.failovers.append((group, failed_at, detected_at, self.env.now))
+        self.unavailable_since[group] = None
+
+    def unavailability(self, group):
+        # Time the group spent between a primary failure and its replacement, including a window still open
+        downtime = sum(elected - failed for g, failed, _, elected in self.failovers if g == group)
+        downtime += sum(recovered - failed for g, failed, recovered in self.lease_blips if g == group)
+        if self.unavailable_since[group] is not None:
+            downtime += self.env.now - self.unavailable_since[group]
+        return downtime
+
+    def failure_process(self):
+        for _ in range(self.num_requests):
             yield self.env.timeout(1)
             for node in self.nodes:
                 failure_prob = 0.01 * (node.replica_group + 1)  # Make failure probability group-dependent
                 if random.random() < failure_prob:
                     if not node.failed:
-                        node.failed = True
+                        self.fail(node)
                         print(f"Node {node.node_id} failed at time {self.env.now}")
                 elif node.failed and random.random() < 0.1:  # 10% chance of recovery
-                    node.failed = False
+                    self.recover(node)
                     print(f"Node {node.node_id} recovered at time {self.env.now}")
 
-# Initialize SimPy environment
-env = simpy.Environment()
-
-# Create and run simulator
-sim = Simulator(env)
-env.process(sim.run())
-env.run(until=NUM_CLIENT_REQUESTS * 2)
-
-# Calculate and print statistics
-total_latency = sum(sim.total_latency)
-average_latency = total_latency / NUM_CLIENT_REQUESTS
-average_network_overhead = sim.total_network_overhead / (NUM_CLIENT_REQUESTS * 2)  # Note: Using total simulation time
-
-# Calculate overall availability
-overall_availability = sim.successful_requests / sim.total_requests if sim.total_requests > 0 else 0
-availability_per_group = [
-    sum(node.requests_handled for node in sim.nodes if node.replica_group == group) / 
-    (NUM_CLIENT_REQUESTS / NUM_REPLICA_GROUPS)
-    for group in range(NUM_REPLICA_GROUPS)
-]
+    def run(self):
+        # Failures run alongside the requests
+        if self.failures:
+            self.env.process(self.failure_process())
 
-# Print statistics
-print(f"1. Average Latency: {average_latency:.2f} ms")
-print(f"2. Overall Availability: {overall_availability:.2%}")
-#print(f"3. Availability per Replica Group: {availability_per_group}")
-formatted_availability = [f"{availability:.3f}%" for availability in availability_per_group]
-print(f"3. Availability per Replica Group: {formatted_availability}")
-print(f"4. Average Network Overhead per Request: {average_network_overhead:.3f} MB")  # Note: Using total simulation time
+        # Open loop: requests arrive on a Poisson schedule and queue at the nodes they need
+        for i in range(self.num_requests):
+            yield self.env.timeout(random.expovariate(self.arrival_rate))
+            self.total_requests += 1
+            client = random.choice(self.nodes)
+            self.env.process(self.handle_request(client))
+
+def load_sweep(offered_loads=(2, 6, 10, 14, 16, 18, 22)):
+    # Failure-free runs at increasing offered load
+    def run(offered_load):
+        sweep_env = simpy.Environment()
+        sweep = Simulator(sweep_env, arrival_rate=offered_load, failures=False, num_requests=SWEEP_REQUESTS)
+        sweep_env.process(sweep.run())
+        sweep_env.run(until=SWEEP_REQUESTS / offered_load)
+        return sweep.request_latencies, sweep_env.now
+    saturation_sweep(offered_loads, run, "requests")
+
+if __name__ == "__main__":
+    # Initialize SimPy environment
+    env = simpy.Environment()
+
+    # Create and run simulator
+    sim = Simulator(env)
+    env.process(sim.run())
+    env.run(until=NUM_CLIENT_REQUESTS * 2)
+
+    # Calculate and print statistics
+    # Client requests only, over the ones that completed; primary_process background work is left out
+    request_latencies = sim.request_latencies
+    average_latency = sum(request_latencies) / len(request_latencies) if request_latencies else 0
+    average_network_overhead = sim.total_network_overhead / (NUM_CLIENT_REQUESTS * 2)  # Note: Using total simulation time
+
+    # Calculate overall availability
+    overall_availability = sim.successful_requests / sim.total_requests if sim.total_requests > 0 else 0
+    availability_per_group = [
+        sum(node.requests_handled for node in sim.nodes if node.replica_group == group) / 
+        (NUM_CLIENT_REQUESTS / NUM_REPLICA_GROUPS)
+        for group in range(NUM_REPLICA_GROUPS)
+    ]
+
+    # Print statistics
+    print(f"1. Average Latency: {average_latency:.2f} ms, p50: {percentile(request_latencies, 0.5):.2f} ms, "
+          f"p99: {percentile(request_latencies, 0.99):.2f} ms")
+    print(f"2. Overall Availability: {overall_availability:.2%}")
+    #print(f"3. Availability per Replica Group: {availability_per_group}")
+    formatted_availability = [f"{availability:.3f}%" for availability in availability_per_group]
+    print(f"3. Availability per Replica Group: {formatted_availability}")
+    print(f"4. Average Network Overhead per Request: {average_network_overhead:.3f} MB")  # Note: Using total simulation time
+
+    # Failover time runs from the primary's failure until a new primary is elected
+    failover_times = [elected - failed for _, failed, _, elected in sim.failovers]
+    detection_delays = [detected - failed for _, failed, detected, _ in sim.failovers]
+    average_failover = sum(failover_times) / len(failover_times) if failover_times else 0
+    average_detection = sum(detection_delays) / len(detection_delays) if detection_delays else 0
+    print(f"5. Failovers: {len(failover_times)}, Average Detection Delay: {average_detection:.2f} ms, "
+          f"Average Failover Time: {average_failover:.2f} ms, p99: {percentile(failover_times, 0.99):.2f} ms "
+          f"({len(sim.lease_blips)} primaries back within their lease)")
+    formatted_unavailability = [f"{sim.unavailability(group) / env.now:.2%}" for group in range(NUM_REPLICA_GROUPS)]
+    print(f"6. Primary Unavailability per Replica Group: {formatted_unavailability}")
+
+    # The load sweep only runs with --benchmarks
+    if "--benchmarks" in sys.argv:
+        load_sweep()
 
 '''
 import simpy
@@ -1,11 +1,79 @@
+import asyncio
+import math
+import multiprocessing
 import random
+import struct
+import sys
 import time
+from collections import deque
+
+import simpy
 
 # Constants
 NUM_NODES = 5
 NUM_PROPOSALS = 100
 FAILURE_RATE = 0.01
 RECOVERY_RATE = 0.1
+HEARTBEAT_INTERVAL = 5  # Steps between leader heartbeats in Multi-Paxos mode
+LEASE_DURATION = 10  # Steps a leader's lease lasts after a majority acknowledged a heartbeat
+MAX_PROPOSERS = 1024  # Ballots are (round, proposer_id) packed as round * MAX_PROPOSERS + proposer_id
+MAX_BACKOFF = 64  # Cap, in steps, on the randomized exponential backoff after a NACK
+QUORUM_SPARES = 2  # Acceptors messaged beyond the quorum itself (rows or columns for grid quorums)
+
+# Batching and pipelining
+BATCH_SIZE = 1  # Client values packed into one slot
+PIPELINE_WINDOW = 1  # Slots the leader may have in flight at once
+NUM_CLIENTS = 512  # Closed-loop clients, each with one outstanding command; raised to fill batch x window
+PIPELINE_STEP_TIME = 1.0  # ms of modeled clock per failure draw and lease step in the pipelined run
+NUM_COMMANDS = 20000
+VALUE_BYTES = 64
+MESSAGE_HEADER_BYTES = 32
+ROUND_TRIP_TIME = 1.0  # ms between the leader finishing a send and hearing from a quorum
+LINK_BANDWIDTH = 125000  # Bytes per ms on the leader's link (1 Gbit/s)
+MESSAGE_OVERHEAD = 0.01  # ms of leader CPU per message sent
+LATENCY_FLOOR = 0.01  # ms where the first latency histogram bucket starts
+LATENCY_GROWTH = 1.01  # Each bucket is 1% wider than the one before, so percentiles are within 1%
+LATENCY_BUCKETS = 2000  # Covers up to LATENCY_FLOOR * LATENCY_GROWTH ** LATENCY_BUCKETS, about 4e6 ms
+LOG_LATENCY_GROWTH = math.log(LATENCY_GROWTH)
+
+# Replicated log
+SNAPSHOT_INTERVAL = 100  # Applied slots between snapshots; the log before a snapshot is dropped
+LOG_COMMANDS = 2000000
+
+# Leaderless (EPaxos-style) mode
+EPAXOS_COMMANDS = 20000
+COMMANDS_PER_STEP = 4  # Commands started concurrently, each at a random live replica
+NUM_KEYS = 100000
+CONFLICT_RATE = 0.02  # Fraction of commands that write one shared hot key
+
+# Discrete-event engine
+SIM_TIME = 10000  # ms of simulated time
+NUM_PROPOSERS = 3
+MIN_MESSAGE_DELAY = 0.5  # ms per hop
+MAX_MESSAGE_DELAY = 2.5
+MESSAGE_LOSS_RATE = 0.01
+PHASE_TIMEOUT = 10  # ms a proposer waits for a quorum before retrying
+BACKOFF_BASE = PHASE_TIMEOUT / 2  # ms per backoff unit, so the first retry waits up to one PHASE_TIMEOUT
+FAILURE_CHECK_INTERVAL = 10  # ms between failure/recovery draws
+
+# asyncio runtime
+ASYNC_NUM_COMMANDS = 20000
+ASYNC_CLIENTS = 64  # Concurrent clients, which bounds the number of slots in flight
+ASYNC_BASE_PORT = 47100
+ASYNC_CONNECT_TIMEOUT = 5  # Seconds to wait for the acceptor processes to accept connections
+ASYNC_VALUE = b"x" * VALUE_BYTES
+
+# Wire format: a 4-byte length prefix, then kind, sender, ballot, slot and accepted ballot,
+# then the raw value bytes
+PREPARE, PROMISE, ACCEPT, ACCEPTED, NACK = range(5)
+FRAME = struct.Struct("!I")
+MESSAGE = struct.Struct("!BBqqq")
+
+def make_ballot(round, proposer_id):
+    return round * MAX_PROPOSERS + proposer_id
+
+def ballot_round(ballot):
+    return ballot // MAX_PROPOSERS
 
 class Node:
     def __init__(self, id):
@@ -13,6 +81,13 @@ class Node:
         self.promised_id = -1
         self.accepted_id = -1
         self.accepted_value = None
+        self.accepted = {}  # Slot -> (ballot, value) for the Multi-Paxos log
+        self.kv = {}  # Key-value state machine fed by the chosen log
+        self.applied = -1  # Highest slot applied to kv
+        self.snapshot = {}
+        self.snapshot_slot = -1  # Log entries up to here are folded into the snapshot
+        self.recovered_at = None
+        self.messages_handled = 0
         self.is_failed = False
         self.total_time = 0
         self.failed_time = 0
@@ -44,66 +119,446 @@ class Node:
             return True
         return False
 
+    def receive_prepare_slots(self, ballot, first_slot):
+        # Phase 1 for every slot from first_slot on, run once per Multi-Paxos leader
+        if self.is_failed:
+            return None
+        if ballot > self.promised_id:
+            self.promised_id = ballot
+            return {slot: entry for slot, entry in self.accepted.items() if slot >= first_slot}
+        return None
+
+    def receive_accept_slot(self, ballot, slot, value):
+        if self.is_failed:
+            return False
+        if ballot >= self.promised_id:
+            self.promised_id = ballot
+            self.accepted[slot] = (ballot, value)
+            return True
+        return False
+
+    def receive_heartbeat(self, ballot):
+        return not self.is_failed and ballot >= self.promised_id
+
+    def apply(self, slot, value):
+        # A slot holds one (key, value) command or a batch of them
+        for key, command_value in (value if isinstance(value, list) else [value]):
+            self.kv[key] = command_value
+        self.applied = slot
+        if self.applied - self.snapshot_slot >= SNAPSHOT_INTERVAL:
+            self.take_snapshot()
+
+    def take_snapshot(self):
+        self.snapshot = dict(self.kv)
+        self.snapshot_slot = self.applied
+        self.compact()
+
+    def install_snapshot(self, snapshot_slot, snapshot):
+        self.kv = dict(snapshot)
+        self.snapshot = snapshot
+        self.applied = self.snapshot_slot = snapshot_slot
+        self.compact()
+
+    def compact(self):
+        for slot in [slot for slot in self.accepted if slot <= self.snapshot_slot]:
+            del self.accepted[slot]
+
+class QuorumSystem:
+    # Phase 1 and phase 2 quorums only have to intersect each other (|Q1| + |Q2| > N), not be majorities.
+    # With grid_rows set, a phase 2 quorum is any full row and a phase 1 quorum any full column.
+    def __init__(self, num_nodes, phase1_size=None, phase2_size=None, spares=None, grid_rows=None):
+        self.num_nodes = num_nodes
+        self.spares = spares  # None messages every acceptor
+        self.lines = None
+        majority = num_nodes // 2 + 1
+        self.sizes = {1: phase1_size or majority, 2: phase2_size or majority}
+        if grid_rows:
+            if num_nodes % grid_rows:
+                raise ValueError("grid_rows must divide the number of nodes")
+            cols = num_nodes // grid_rows
+            self.lines = {
+                1: [[row * cols + col for row in range(grid_rows)] for col in range(cols)],
+                2: [[row * cols + col for col in range(cols)] for row in range(grid_rows)],
+            }
+        elif self.sizes[1] + self.sizes[2] <= num_nodes:
+            raise ValueError("Phase 1 and phase 2 quorums must intersect: |Q1| + |Q2| > N")
+
+    def targets(self, nodes, phase):
+        if self.spares is None:
+            return nodes
+        if self.lines:
+            lines = random.sample(self.lines[phase], min(len(self.lines[phase]), 1 + self.spares))
+            return [nodes[i] for line in lines for i in line]
+        return random.sample(nodes, min(len(nodes), self.sizes[phase] + self.spares))
+
+    def is_quorum(self, phase, responders):
+        if self.lines:
+            responded = set(responders)
+            return any(all(i in responded for i in line) for line in self.lines[phase])
+        return len(responders) >= self.sizes[phase]
+
+class Proposer:
+    def __init__(self, id):
+        self.id = id
+        self.round = 0
+        self.ballot = -1
+        self.value = None
+        self.phase = "prepare"
+        self.ready_step = 0
+        self.nacks = 0  # Consecutive NACKs, which sets the backoff window
+
 class PaxosSystem:
-    def __init__(self, num_nodes):
+    def __init__(self, num_nodes, multi_paxos=False, batch_size=BATCH_SIZE, pipeline_window=PIPELINE_WINDOW, quorums=None):
         self.nodes = [Node(i) for i in range(num_nodes)]
+        self.quorums = quorums or QuorumSystem(num_nodes)
+        self.multi_paxos = multi_paxos
+        self.batch_size = batch_size
+        self.pipeline_window = pipeline_window
         self.total_proposals = 0
         self.successful_proposals = 0
         self.total_latency = 0
+        self.messages = 0
+        self.round_trips = 0
+        self.proposer_rounds = [0] * num_nodes
+        self.proposer_nacks = [0] * num_nodes  # Consecutive NACKs per proposer, which sets its backoff window
+        self.retries = []  # (step, proposer_id, value) for NACKed proposals waiting out their backoff
+
+        # Multi-Paxos state
+        self.step = 0
+        self.leader = None
+        self.leader_ballot = -1
+        self.lease_expiry = -1
+        self.next_slot = 0
+        self.chosen = {}  # Slot -> value, kept only above the latest snapshot in Multi-Paxos mode
+        self.elections = 0
+        self.snapshot = {}
+        self.snapshot_slot = -1
+        self.snapshots_installed = 0
+        self.entries_replayed = 0
+        self.recoveries = []  # (modeled ms, entries a full replay would have needed, entries replayed)
+
+        # Modeled clock for the pipelined run, in ms
+        self.clock = 0
+        self.committed_commands = 0
+        self.latency_histogram = [0] * LATENCY_BUCKETS  # Fixed size however many commands commit
 
     def propose(self, proposer_id, value):
-        proposal_id = random.randint(1, 1000000)
-        prepare_phase = self.prepare(proposer_id, proposal_id)
-        if prepare_phase:
-            return self.accept(proposer_id, proposal_id, value)
+        self.proposer_rounds[proposer_id] += 1
+        proposal_id = make_ballot(self.proposer_rounds[proposer_id], proposer_id)
+        promised, accepted_value, highest_promise = self.prepare(proposer_id, proposal_id)
+        if promised:
+            # A value accepted under an earlier ballot may already be chosen, so carry it forward
+            if accepted_value is not None:
+                value = accepted_value
+            accepted, highest_promise = self.accept(proposer_id, proposal_id, value)
+            if accepted:
+                self.proposer_nacks[proposer_id] = 0
+                return True
+        # NACKed or short of a quorum: the next attempt starts above the highest ballot seen and
+        # waits out a randomized exponential backoff
+        self.proposer_rounds[proposer_id] = max(self.proposer_rounds[proposer_id], ballot_round(highest_promise))
+        self.proposer_nacks[proposer_id] += 1
+        window = min(2 ** self.proposer_nacks[proposer_id], MAX_BACKOFF)
+        self.retries.append((self.step + 1 + random.randrange(window), proposer_id, value))
         return False
 
+    def quorum_round(self, phase, request, coordinator=None):
+        # Message the phase's target quorum plus spares; if that falls short, a second round trip
+        # goes to the acceptors that were left out. NACKs from live acceptors carry their promise.
+        replies = []
+        highest_promise = -1
+        targets = self.quorums.targets(self.nodes, phase)
+        targeted = {node.id for node in targets}
+        rounds = [targets]
+        if len(targets) < len(self.nodes):
+            rounds.append([node for node in self.nodes if node.id not in targeted])
+
+        for nodes in rounds:
+            for node in nodes:
+                self.messages += 1
+                reply = request(node)
+                if not node.is_failed:
+                    self.messages += 1
+                    node.messages_handled += 2  # The request and the reply
+                    if coordinator is not None:
+                        coordinator.messages_handled += 2
+                if reply is not None and reply is not False:
+                    replies.append((node, reply))
+                elif not node.is_failed:
+                    highest_promise = max(highest_promise, node.promised_id)
+            self.round_trips += 1
+            reached = self.quorums.is_quorum(phase, [node.id for node, _ in replies])
+            if reached:
+                break
+        return reached, replies, highest_promise
+
     def prepare(self, proposer_id, proposal_id):
-        promises = 0
+        promised, replies, highest_promise = self.quorum_round(
+            1, lambda node: node.receive_prepare(proposal_id), self.nodes[proposer_id])
         highest_accepted_id = -1
         highest_accepted_value = None
-
-        for node in self.nodes:
-            response = node.receive_prepare(proposal_id)
-            if response is not None:
-                promises += 1
-                accepted_id, accepted_value = response
-                if accepted_id > highest_accepted_id:
-                    highest_accepted_id = accepted_id
-                    highest_accepted_value = accepted_value
-
-        return promises > len(self.nodes) // 2
+        for _, (accepted_id, accepted_value) in replies:
+            if accepted_id > highest_accepted_id:
+                highest_accepted_id = accepted_id
+                highest_accepted_value = accepted_value
+        return promised, highest_accepted_value, highest_promise
 
     def accept(self, proposer_id, proposal_id, value):
-        accepts = 0
         start_time = time.time()
+        accepted, _, highest_promise = self.quorum_round(
+            2, lambda node: node.receive_accept(proposal_id, value), self.nodes[proposer_id])
+        if accepted:
+            end_time = time.time()
+            self.total_latency += end_time - start_time
+            self.successful_proposals += 1
+        return accepted, highest_promise
 
-        for node in self.nodes:
-            if node.receive_accept(proposal_id, value):
-                accepts += 1
+    def elect_leader(self):
+        # The lowest-id live node stands for election and runs phase 1 for all open slots at once
+        candidate = next((node for node in self.nodes if not node.is_failed), None)
+        if candidate is None:
+            return False
+        self.elections += 1
+        ballot = make_ballot(ballot_round(max(self.leader_ballot, candidate.promised_id)) + 1, candidate.id)
+        first_slot = self.next_slot
+        promised, replies, highest_promise = self.quorum_round(
+            1, lambda node: node.receive_prepare_slots(ballot, first_slot), candidate)
+        self.leader_ballot = max(self.leader_ballot, highest_promise)
+        if not promised:
+            return False
+
+        previously_accepted = {}
+        for _, response in replies:
+            for slot, (accepted_ballot, value) in response.items():
+                if slot not in previously_accepted or accepted_ballot > previously_accepted[slot][0]:
+                    previously_accepted[slot] = (accepted_ballot, value)
+
+        self.leader = candidate.id
+        self.leader_ballot = ballot
+        self.lease_expiry = self.step + LEASE_DURATION
+        # Finish the slots an earlier leader may have got accepted, so chosen values are never lost
+        for slot in sorted(previously_accepted):
+            self.next_slot = slot
+            self.accept_slot(previously_accepted[slot][1])
+        return self.leader is not None
 
-        if accepts > len(self.nodes) // 2:
+    def heartbeat(self):
+        # The leader renews its lease while a phase 2 quorum still acknowledges its ballot
+        if self.leader is None or self.step % HEARTBEAT_INTERVAL != 0:
+            return
+        if self.nodes[self.leader].is_failed:
+            return
+        round_trips = self.round_trips
+        acknowledged, _, _ = self.quorum_round(
+            2, lambda node: node.receive_heartbeat(self.leader_ballot), self.nodes[self.leader])
+        self.round_trips = round_trips  # Heartbeats are off the commit path
+        if acknowledged:
+            self.lease_expiry = self.step + LEASE_DURATION
+
+    def accept_slot(self, value):
+        # Phase 2 only, under the leader's ballot
+        start_time = time.time()
+        accepted, _, highest_promise = self.quorum_round(
+            2, lambda node: node.receive_accept_slot(self.leader_ballot, self.next_slot, value), self.nodes[self.leader])
+
+        if accepted:
             end_time = time.time()
             self.total_latency += end_time - start_time
+            self.chosen[self.next_slot] = value
+            self.next_slot += 1
+            self.apply_chosen()
+            return True
+        if highest_promise > self.leader_ballot:
+            self.leader = None  # A higher ballot has been promised, leadership is lost
+        return False
+
+    def apply_chosen(self):
+        # The commit point rides on the next message to each live node, which then applies the log
+        for node in self.nodes:
+            if not node.is_failed and node.applied < self.next_slot - 1:
+                self.catch_up(node)
+
+        leader = self.nodes[self.leader] if self.leader is not None else None
+        if leader is not None and leader.snapshot_slot > self.snapshot_slot:
+            # The leader's latest snapshot is what lagging nodes install, so the log below it can go
+            self.snapshot, self.snapshot_slot = leader.snapshot, leader.snapshot_slot
+            for slot in [slot for slot in self.chosen if slot <= self.snapshot_slot]:
+                del self.chosen[slot]
+
+    def catch_up(self, node):
+        # Entries the node accepted under the deciding ballot are applied from its own log;
+        # anything older comes from the latest snapshot, and the rest is shipped from the leader
+        transferred = 0
+        behind = self.next_slot - 1 - node.applied
+        replayed = 0
+        if node.applied < self.snapshot_slot:
+            node.install_snapshot(self.snapshot_slot, self.snapshot)
+            transferred += len(self.snapshot) * VALUE_BYTES
+            self.snapshots_installed += 1
+        for slot in range(node.applied + 1, self.next_slot):
+            value = self.chosen[slot]
+            entry = node.accepted.get(slot)
+            if entry is None or entry[1] is not value:
+                transferred += MESSAGE_HEADER_BYTES + VALUE_BYTES * (len(value) if isinstance(value, list) else 1)
+                replayed += 1
+            node.apply(slot, value)
+        self.entries_replayed += replayed
+
+        if node.recovered_at is not None:
+            transfer_time = ROUND_TRIP_TIME + transferred / LINK_BANDWIDTH if transferred else 0
+            self.recoveries.append((self.clock - node.recovered_at + transfer_time, behind, replayed))
+            node.recovered_at = None
+
+    def propose_multi(self, value):
+        if self.leader is None or self.step > self.lease_expiry:
+            if not self.elect_leader():
+                return False
+        if self.nodes[self.leader].is_failed:
+            return False  # Requests fail until the lease runs out and a new leader is elected
+        if self.accept_slot(value):
             self.successful_proposals += 1
             return True
         return False
 
+    def simulate_failures(self):
+        for node in self.nodes:
+            node.update_time()  # Update time before changing the node state
+            if not node.is_failed and random.random() < FAILURE_RATE:
+                node.is_failed = True
+            elif node.is_failed and random.random() < RECOVERY_RATE:
+                node.is_failed = False
+                node.recovered_at = self.clock
+
+    def run_pipelined_simulation(self, num_commands, num_clients=None):
+        # Multi-Paxos leader packing up to batch_size client values per slot, with up to
+        # pipeline_window slots in flight. The leader's link sends one slot at a time, and a
+        # slot commits one round trip after its accepts have gone out. Failures and leases follow
+        # the modeled clock, so every configuration sees the same failures per second.
+        self.multi_paxos = True
+        num_clients = num_clients or max(NUM_CLIENTS, self.batch_size * self.pipeline_window)
+        # Commands waiting for a slot, as (client, submit time); each one writes its client's key
+        pending = deque((client, 0.0) for client in range(num_clients))
+        in_flight = deque()  # (commit_time, commands, accepted) in send order
+        link_free = 0.0
+
+        while self.committed_commands < num_commands:
+            if pending and len(in_flight) < self.pipeline_window:
+                self.clock = max(self.clock, link_free)
+                batch = [pending.popleft() for _ in range(min(self.batch_size, len(pending)))]
+                while self.step < self.clock / PIPELINE_STEP_TIME:
+                    self.step += 1
+                    self.simulate_failures()
+                    self.heartbeat()
+                self.total_proposals += 1
+                accepted = self.propose_multi(batch)
+
+                message_bytes = MESSAGE_HEADER_BYTES + VALUE_BYTES * len(batch)
+                send_time = len(self.nodes) * (MESSAGE_OVERHEAD + message_bytes / LINK_BANDWIDTH)
+                link_free = self.clock + send_time
+                in_flight.append((link_free + ROUND_TRIP_TIME, batch, accepted))
+                continue
+
+            commit_time, batch, accepted = in_flight.popleft()
+            self.clock = max(self.clock, commit_time)
+            if accepted:
+                self.committed_commands += len(batch)
+                self.record_latencies(batch)
+                pending.extend((client, self.clock) for client, _ in batch)  # Clients send their next command
+            else:
+                pending.extendleft(reversed(batch))  # Retried in a later slot
+
+    def record_latencies(self, batch):
+        # Commands that were submitted together, as most of a batch was, share one bucket lookup
+        last_submitted = bucket = None
+        for _, submitted in batch:
+            if submitted != last_submitted:
+                last_submitted = submitted
+                latency = max(self.clock - submitted, LATENCY_FLOOR)
+                bucket = min(int(math.log(latency / LATENCY_FLOOR) / LOG_LATENCY_GROWTH), LATENCY_BUCKETS - 1)
+            self.latency_histogram[bucket] += 1
+
+    def latency_percentile(self, percentile):
+        # Geometric middle of the bucket holding the percentile
+        count = sum(self.latency_histogram)
+        if not count:
+            return 0
+        rank = min(count - 1, int(count * percentile / 100))
+        seen = 0
+        for bucket, bucket_count in enumerate(self.latency_histogram):
+            seen += bucket_count
+            if seen > rank:
+                return LATENCY_FLOOR * LATENCY_GROWTH ** (bucket + 0.5)
+
+    def run_contention_simulation(self, num_proposers, num_decisions, backoff=True, max_steps=None):
+        # Proposers act one phase per step, in random order, so their prepares and accepts
+        # interleave and can duel over the same slot. A step is one round trip.
+        proposers = [Proposer(i) for i in range(num_proposers)]
+        max_steps = max_steps or num_decisions * 200
+        slot = 0
+        decision_start = 0
+        self.wasted_rounds = 0
+        self.decision_times = []
+
+        for step in range(max_steps):
+            if slot == num_decisions:
+                break
+            self.step = step
+            self.simulate_failures()
+            random.shuffle(proposers)
+            for proposer in proposers:
+                if step < proposer.ready_step:
+                    continue
+                if proposer.phase == "prepare":
+                    proposer.round += 1
+                    proposer.ballot = make_ballot(proposer.round, proposer.id)
+                    promised, replies, highest_promise = self.quorum_round(
+                        1, lambda node: node.receive_prepare_slots(proposer.ballot, slot))
+                    if promised:
+                        accepted = [reply[slot] for _, reply in replies if slot in reply]
+                        proposer.value = max(accepted)[1] if accepted else f"Value-{proposer.id}-{slot}"
+                        proposer.phase = "accept"
+                        continue
+                else:
+                    chosen, _, highest_promise = self.quorum_round(
+                        2, lambda node: node.receive_accept_slot(proposer.ballot, slot, proposer.value))
+                    if chosen:
+                        self.chosen[slot] = proposer.value
+                        self.decision_times.append(step - decision_start + 1)
+                        slot += 1
+                        decision_start = step + 1
+                        for other in proposers:
+                            other.phase = "prepare"
+                            other.nacks = 0
+                        break
+
+                # NACKed or short of a quorum: jump past the competing ballot and back off
+                self.wasted_rounds += 1
+                proposer.round = max(proposer.round, ballot_round(highest_promise))
+                proposer.phase = "prepare"
+                proposer.nacks += 1
+                if backoff:
+                    window = min(2 ** proposer.nacks, MAX_BACKOFF)
+                    proposer.ready_step = step + 1 + random.randrange(window)
+        return slot
+
     def run_simulation(self, num_proposals):
         for _ in range(num_proposals):
+            self.step += 1
             self.total_proposals += 1
             proposer_id = random.randint(0, len(self.nodes) - 1)
             value = f"Value-{random.randint(1, 1000)}"
 
-            # Simulate node failures and recoveries
-            for node in self.nodes:
-                node.update_time()  # Update time before changing the node state
-                if not node.is_failed and random.random() < FAILURE_RATE:
-                    node.is_failed = True
-                elif node.is_failed and random.random() < RECOVERY_RATE:
-                    node.is_failed = False
-
-            self.propose(proposer_id, value)
+            self.simulate_failures()
+            if self.multi_paxos:
+                self.heartbeat()
+                self.propose_multi((proposer_id, value))
+            else:
+                # Proposals whose backoff has run out go first
+                due = [retry for retry in self.retries if retry[0] <= self.step]
+                self.retries = [retry for retry in self.retries if retry[0] > self.step]
+                for _, retry_proposer, retry_value in due:
+                    self.propose(retry_proposer, retry_value)
+                self.propose(proposer_id, value)
 
     def print_results(self):
         availability = self.successful_proposals / self.total_proposals if self.total_proposals > 0 else 0
@@ -115,6 +570,11 @@ class PaxosSystem:
         print(f"1. Average Latency: {avg_latency:.3f} ms")
         print(f"2. Overall Availability: {availability:.2%}")
         print(f"3. Average Network Overhead per Request: {avg_network_overhead:.6f} MB")
+        if self.successful_proposals > 0:
+            print(f"4. Messages per Committed Value: {self.messages / self.successful_proposals:.2f}")
+            print(f"5. Round Trips per Committed Value: {self.round_trips / self.successful_proposals:.2f}")
+        if self.multi_paxos:
+            print(f"6. Leader Elections: {self.elections}")
         print(f"Successful Proposals: {self.successful_proposals}")
         print(f"Total Proposals: {self.total_proposals}")
 
@@ -123,128 +583,634 @@ class PaxosSystem:
             node_availability = (node.total_time - node.failed_time) / node.total_time if node.total_time > 0 else 0
             print(f"Node {node.id} Availability: {node_availability:.2%}")
 
-if __name__ == "__main__":
-    paxos_system = PaxosSystem(NUM_NODES)
-    paxos_system.run_simulation(NUM_PROPOSALS)
-    paxos_system.print_results()
+class EPaxosReplica:
+    def __init__(self, id):
+        self.id = id
+        self.is_failed = False
+        self.next_instance = 0
+        self.latest = {}  # Key -> (instance, seq) of the latest interfering command seen
+        self.messages_handled = 0
+
+    def pre_accept(self, instance, key, seq, deps):
+        # Extend the proposed attributes with the latest conflicting command this replica knows of
+        if self.is_failed:
+            return None
+        latest = self.latest.get(key)
+        if latest is not None and latest[0] != instance and latest[0] not in deps:
+            seq = max(seq, latest[1] + 1)
+            deps = deps | {latest[0]}
+        self.record(instance, key, seq)
+        return seq, deps
 
+    def record(self, instance, key, seq):
+        latest = self.latest.get(key)
+        if latest is None or seq >= latest[1]:
+            self.latest[key] = (instance, seq)
 
-'''from multiprocessing import Manager
-from concurrent.futures import ProcessPoolExecutor
-import random
-import time
+class EPaxosSystem:
+    # Leaderless: each command is led by the replica the client reached. It commits after one
+    # round trip when a fast quorum reports the same seq/deps, and after an extra accept round
+    # otherwise. Execution follows the dependency graph, so only conflicting commands are ordered.
+    def __init__(self, num_nodes, conflict_rate=CONFLICT_RATE):
+        self.nodes = [EPaxosReplica(i) for i in range(num_nodes)]
+        self.conflict_rate = conflict_rate
+        faults = (num_nodes - 1) // 2
+        self.fast_quorum = faults + (faults + 1) // 2
+        self.slow_quorum = faults + 1
+        self.instances = {}  # Committed, not yet executed: instance -> (command, seq, deps)
+        self.kv = {}
+        self.executed = 0
+        self.fast_commits = 0
+        self.slow_commits = 0
+        self.failed_commands = 0
+        self.latencies = []  # ms
+        self.messages = 0
 
-# Constants
-NUM_MESSAGES = 10
-PREPARE = "PREPARE"
-PROMISE = "PROMISE"
+    def send(self, source, destination):
+        self.messages += 1
+        source.messages_handled += 1
+        if not destination.is_failed:
+            destination.messages_handled += 1
 
-class Node:
-    def __init__(self, rank, nodes, lock, queue, initial_latency=0, initial_network_overhead=0):
-        self.rank = rank
-        self.nodes = nodes
-        self.lock = lock
-        self.queue = queue
-        self.latency = initial_latency
-        self.network_overhead = initial_network_overhead
-        self.failed = False
-        self.accepted_round = -1
-        self.accepted_value = None
+    def simulate_failures(self):
+        for node in self.nodes:
+            if not node.is_failed and random.random() < FAILURE_RATE:
+                node.is_failed = True
+            elif node.is_failed and random.random() < RECOVERY_RATE:
+                node.is_failed = False
+
+    def run_simulation(self, num_commands):
+        while self.fast_commits + self.slow_commits < num_commands:
+            self.simulate_failures()
+            proposals = []
+            for _ in range(COMMANDS_PER_STEP):
+                live = [node for node in self.nodes if not node.is_failed]
+                if not live:
+                    break
+                leader = random.choice(live)
+                key = 0 if random.random() < self.conflict_rate else random.randint(1, NUM_KEYS)
+                instance = (leader.id, leader.next_instance)
+                leader.next_instance += 1
+                seq, deps = leader.pre_accept(instance, key, 0, frozenset())
+                proposals.append((leader, instance, (key, len(self.latencies)), seq, deps, []))
 
-    def run(self):
-        for _ in range(random.randint(1, NUM_MESSAGES)):  # Send a random number of messages
-            self.propose()
+            # PreAccepts from concurrent leaders reach the other replicas in random order
+            deliveries = [(proposal, node) for proposal in proposals for node in self.nodes if node is not proposal[0]]
+            random.shuffle(deliveries)
+            for proposal, node in deliveries:
+                self.send(proposal[0], node)
+                reply = node.pre_accept(proposal[1], proposal[2][0], proposal[3], proposal[4])
+                if reply is not None:
+                    self.send(node, proposal[0])
+                    proposal[5].append((node, reply))
 
-    def handle_messages(self):
-        for _ in range(random.randint(1, NUM_MESSAGES)):  # Receive and handle a random number of messages
-            if not self.failed:
-                self.receive_messages()
+            for proposal in proposals:
+                self.decide(*proposal)
+            self.execute()
 
-    def propose(self):
-        proposed_value = f"Value from Node {self.rank}"
-        proposed_round = random.randint(1, 1000)
+    def decide(self, leader, instance, command, seq, deps, replies):
+        key = command[0]
+        fast_replies = replies[:self.fast_quorum - 1]
+        if len(fast_replies) == self.fast_quorum - 1 and all(reply == (seq, deps) for _, reply in fast_replies):
+            self.fast_commits += 1
+            self.latencies.append(ROUND_TRIP_TIME)
+        elif len(replies) + 1 >= self.slow_quorum:
+            # Slow path: take the union of what a majority reported and make it durable there
+            quorum = replies[:self.slow_quorum - 1]
+            seq = max([seq] + [reply[0] for _, reply in quorum])
+            deps = deps.union(*(reply[1] for _, reply in quorum))
+            for node, _ in quorum:
+                self.send(leader, node)
+                node.record(instance, key, seq)
+                self.send(node, leader)
+            self.slow_commits += 1
+            self.latencies.append(2 * ROUND_TRIP_TIME)
+        else:
+            # No quorum; recovery by another replica commits the instance as a no-op
+            command = None
+            self.failed_commands += 1
 
+        leader.record(instance, key, seq)
         for node in self.nodes:
-            if node != self:
-                self.send_prepare(node, proposed_round)
+            if node is not leader:
+                self.send(leader, node)  # Commit, off the latency path
+                if not node.is_failed:
+                    node.record(instance, key, seq)
+        self.instances[instance] = (command, seq, deps)
+
+    def execute(self):
+        # Tarjan's strongly connected components over the committed graph. Components come out
+        # dependencies first; inside one, commands run in (seq, instance) order.
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        for root in list(self.instances):
+            if root in index or root not in self.instances:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self.instances[root][2]))]
+            while work:
+                instance, deps = work[-1]
+                descended = False
+                for dep in deps:
+                    if dep not in self.instances:
+                        continue  # Already executed
+                    if dep not in index:
+                        index[dep] = low[dep] = len(index)
+                        stack.append(dep)
+                        on_stack.add(dep)
+                        work.append((dep, iter(self.instances[dep][2])))
+                        descended = True
+                        break
+                    if dep in on_stack:
+                        low[instance] = min(low[instance], index[dep])
+                if descended:
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[instance])
+                if low[instance] == index[instance]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == instance:
+                            break
+                    for member in sorted(component, key=lambda m: (self.instances[m][1], m)):
+                        command = self.instances.pop(member)[0]
+                        if command is not None:
+                            self.kv[command[0]] = command[1]
+                        self.executed += 1
+
+class SimulatedPaxos:
+    def __init__(self, env, num_nodes, num_proposers=NUM_PROPOSERS):
+        self.env = env
+        self.nodes = [Node(i) for i in range(num_nodes)]
+        self.num_proposers = num_proposers
+        self.chosen = {}  # Slot -> value, as seen by the learner
+        self.first_unchosen = 0
+        self.latencies = []
+        self.messages = 0
+        self.rounds = 0  # Phase 1 + phase 2 attempts, including the ones that lost
+        for proposer_id in range(num_proposers):
+            self.env.process(self.proposer(proposer_id))
+        self.env.process(self.failures())
+
+    def network_delay(self):
+        return random.uniform(MIN_MESSAGE_DELAY, MAX_MESSAGE_DELAY)
+
+    def send(self, node, request, args, tally):
+        # One request/reply exchange with an acceptor; either leg can be delayed or lost
+        self.messages += 1
+        yield self.env.timeout(self.network_delay())
+        if random.random() < MESSAGE_LOSS_RATE:
+            return
+        reply = request(node, *args)
+        if node.is_failed:
+            return
+        self.messages += 1
+        yield self.env.timeout(self.network_delay())
+        if random.random() < MESSAGE_LOSS_RATE:
+            return
+        tally(reply, node.promised_id)
+
+    def run_phase(self, request, *args):
+        # Broadcast request and wait for a quorum of positive replies, a NACK, or the timeout
+        replies = []
+        quorum = self.env.event()
+        nacked = self.env.event()
+        highest_promise = [-1]
+
+        def tally(reply, promised_id):
+            if reply is None or reply is False:
+                highest_promise[0] = max(highest_promise[0], promised_id)
+                if not nacked.triggered:
+                    nacked.succeed()
+                return
+            replies.append(reply)
+            if len(replies) == len(self.nodes) // 2 + 1:
+                quorum.succeed()
 
-        accepted_count = 0
-        start_time = time.time()
         for node in self.nodes:
-            if node != self and node.accepted_round == proposed_round:
-                accepted_count += 1
+            self.env.process(self.send(node, request, args, tally))
+        yield quorum | nacked | self.env.timeout(PHASE_TIMEOUT)
+        self.rounds += 1
+        return (list(replies) if quorum.triggered else None), highest_promise[0]
 
-        if accepted_count >= (len(self.nodes) // 2) + 1:
-            end_time = time.time()
-            self.latency += end_time - start_time
-            self.network_overhead += len(proposed_value.encode())
-            print(f"Node {self.rank} reached consensus: {proposed_value}")
-
-    def send_prepare(self, other_node, round):
-        message = {
-            "type": PREPARE,
-            "round": round,
-            "node_rank": self.rank,
-        }
-        with self.lock:
-            self.queue.put((other_node, message))
-
-    def receive_messages(self):
+    def proposer(self, proposer_id):
+        host = self.nodes[proposer_id % len(self.nodes)]
+        round = 0
+        sequence = 0
+        nacks = 0  # Consecutive lost or timed-out rounds, which sets the backoff window
+        while True:
+            value = (proposer_id, sequence)
+            sequence += 1
+            start_time = self.env.now
+            while True:
+                if host.is_failed:
+                    yield self.env.timeout(FAILURE_CHECK_INTERVAL)
+                    continue
+                while self.first_unchosen in self.chosen:
+                    self.first_unchosen += 1
+                slot = self.first_unchosen
+                round += 1
+                ballot = make_ballot(round, proposer_id)
+
+                promises, highest_promise = yield from self.run_phase(
+                    Node.receive_prepare_slots, ballot, slot)
+                if promises is not None:
+                    # Adopt the highest-ballot value already accepted in this slot
+                    accepted = [promise[slot] for promise in promises if slot in promise]
+                    proposal_value = max(accepted)[1] if accepted else value
+                    accepts, highest_promise = yield from self.run_phase(
+                        Node.receive_accept_slot, ballot, slot, proposal_value)
+                    if accepts is not None:
+                        nacks = 0
+                        self.chosen[slot] = proposal_value
+                        if proposal_value == value:
+                            self.latencies.append(self.env.now - start_time)
+                            break
+                        continue  # Slot went to an earlier value, try the next one
+
+                # Lost to a higher ballot or timed out: jump past it and retry after a randomized
+                # exponential backoff
+                round = max(round, ballot_round(highest_promise))
+                nacks += 1
+                yield self.env.timeout(random.uniform(0, min(2 ** nacks, MAX_BACKOFF) * BACKOFF_BASE))
+
+    def failures(self):
+        while True:
+            yield self.env.timeout(FAILURE_CHECK_INTERVAL)
+            for node in self.nodes:
+                if not node.is_failed and random.random() < FAILURE_RATE:
+                    node.is_failed = True
+                elif node.is_failed and random.random() < RECOVERY_RATE:
+                    node.is_failed = False
+
+    def print_results(self):
+        latencies = sorted(self.latencies)
+        committed = len(latencies)
+        average_latency = sum(latencies) / committed if committed else 0
+        print(f"1. Average Latency: {average_latency:.3f} ms")
+        if committed:
+            print(f"2. Latency p50/p99: {latencies[committed // 2]:.3f} / "
+                  f"{latencies[min(committed - 1, int(committed * 0.99))]:.3f} ms")
+            print(f"3. Messages per Committed Value: {self.messages / committed:.2f}")
+            print(f"4. Rounds per Committed Value: {self.rounds / committed:.2f}")
+        print(f"5. Throughput: {committed / self.env.now * 1000:.0f} commits/s")
+
+def run_event_simulation(num_proposers=NUM_PROPOSERS, seed=0):
+    random.seed(seed)
+    env = simpy.Environment()
+    system = SimulatedPaxos(env, NUM_NODES, num_proposers)
+    env.run(until=SIM_TIME)
+    return system
+
+def compare_modes(num_proposals=NUM_PROPOSALS, seed=0):
+    # Per-proposal Paxos against stable-leader Multi-Paxos under the same failure model
+    for multi_paxos in (False, True):
+        random.seed(seed)
+        system = PaxosSystem(NUM_NODES, multi_paxos=multi_paxos)
+        system.run_simulation(num_proposals)
+        committed = max(system.successful_proposals, 1)
+        print(f"{'Multi-Paxos' if multi_paxos else 'Per-proposal'}: "
+              f"availability {system.successful_proposals / system.total_proposals:.2%}, "
+              f"{system.messages / committed:.2f} messages and "
+              f"{system.round_trips / committed:.2f} round trips per committed value")
+
+def contention_benchmark(proposer_counts=(1, 2, 4, 8, 16), num_decisions=200, seed=0):
+    print("Proposers  Backoff  Decided  Steps to Decide  Wasted Rounds per Decision")
+    for num_proposers in proposer_counts:
+        for backoff in (False, True):
+            random.seed(seed)
+            system = PaxosSystem(NUM_NODES)
+            decided = system.run_contention_simulation(num_proposers, num_decisions, backoff)
+            steps = sum(system.decision_times) / decided if decided else float("inf")
+            wasted = system.wasted_rounds / decided if decided else float("inf")
+            print(f"{num_proposers:9d}  {'on' if backoff else 'off':>7}  {decided:7d}  {steps:15.2f}  {wasted:26.2f}")
+
+def quorum_spares(quorum_size):
+    # Enough spares to cover the acceptors expected to be down under the failure model
+    down = FAILURE_RATE / (FAILURE_RATE + RECOVERY_RATE)
+    return QUORUM_SPARES + round(1.5 * quorum_size * down)
+
+def quorum_configurations(num_nodes):
+    side = next(rows for rows in range(int(num_nodes ** 0.5), 0, -1) if num_nodes % rows == 0)
+    small = max(1, num_nodes // 10)
+    return [
+        ("majority, broadcast", QuorumSystem(num_nodes)),
+        ("majority + spares", QuorumSystem(num_nodes, spares=quorum_spares(num_nodes // 2 + 1))),
+        (f"flexible Q1={num_nodes - small + 1} Q2={small}",
+         QuorumSystem(num_nodes, num_nodes - small + 1, small, spares=quorum_spares(small))),
+        (f"grid {side}x{num_nodes // side}", QuorumSystem(num_nodes, spares=1, grid_rows=side)),
+    ]
+
+def quorum_benchmark(node_counts=(50, 100, 500), num_proposals=300, seed=0):
+    # Multi-Paxos under each quorum configuration. Throughput assumes the leader is bound by
+    # MESSAGE_OVERHEAD per message it sends or receives.
+    print("Nodes  Quorums                      Availability  Messages/Commit  Round Trips/Commit  Leader-bound Commits/s")
+    for num_nodes in node_counts:
+        for name, quorums in quorum_configurations(num_nodes):
+            random.seed(seed)
+            system = PaxosSystem(num_nodes, multi_paxos=True, quorums=quorums)
+            system.run_simulation(num_proposals)
+            committed = max(system.successful_proposals, 1)
+            messages = system.messages / committed
+            print(f"{num_nodes:5d}  {name:27s}  {system.successful_proposals / system.total_proposals:12.2%}  "
+                  f"{messages:15.1f}  {system.round_trips / committed:18.2f}  {1000 / (messages * MESSAGE_OVERHEAD):22.0f}")
+
+def log_compaction_benchmark(num_commands=LOG_COMMANDS, batch_size=128, window=4, seed=0):
+    random.seed(seed)
+    system = PaxosSystem(NUM_NODES, batch_size=batch_size, pipeline_window=window)
+    system.run_pipelined_simulation(num_commands)
+    recoveries = system.recoveries or [(0, 0, 0)]
+    print(f"Commands committed: {system.committed_commands} in {system.next_slot} slots")
+    print(f"Log entries held: leader {len(system.chosen)}, "
+          f"largest acceptor log {max(len(node.accepted) for node in system.nodes)}")
+    print(f"Recoveries: {len(system.recoveries)}, snapshots installed {system.snapshots_installed}")
+    print(f"Average recovery time: {sum(r[0] for r in recoveries) / len(recoveries):.3f} ms, "
+          f"entries replayed {sum(r[2] for r in recoveries) / len(recoveries):.1f} "
+          f"of {sum(r[1] for r in recoveries) / len(recoveries):.1f} behind")
+    states = {tuple(sorted(node.kv.items())) for node in system.nodes if node.applied == system.next_slot - 1}
+    print(f"Up-to-date replicas agree: {len(states) == 1}")
+
+def leaderless_benchmark(conflict_rates=(0, 0.02, 0.1, 0.5), num_commands=EPAXOS_COMMANDS, seed=0):
+    # Single-leader Multi-Paxos pays a forwarding hop unless the client reached the leader
+    print("Mode                   Fast Path  Avg Latency (ms)  Messages/Commit  Max/Mean Node Load")
+    random.seed(seed)
+    system = PaxosSystem(NUM_NODES, multi_paxos=True)
+    system.run_simulation(num_commands)
+    committed = max(system.successful_proposals, 1)
+    latency = (system.round_trips / committed + (1 - 1 / NUM_NODES)) * ROUND_TRIP_TIME
+    loads = [node.messages_handled / committed for node in system.nodes]
+    print(f"{'Multi-Paxos':21s}  {'-':>9}  {latency:16.2f}  {system.messages / committed:15.1f}  "
+          f"{max(loads):8.1f} / {sum(loads) / len(loads):.1f}")
+
+    for conflict_rate in conflict_rates:
+        random.seed(seed)
+        system = EPaxosSystem(NUM_NODES, conflict_rate)
+        system.run_simulation(num_commands)
+        committed = system.fast_commits + system.slow_commits
+        loads = [node.messages_handled / committed for node in system.nodes]
+        print(f"{f'EPaxos, {conflict_rate:.0%} conflicts':21s}  {system.fast_commits / committed:9.1%}  "
+              f"{sum(system.latencies) / committed:16.2f}  {system.messages / committed:15.1f}  "
+              f"{max(loads):8.1f} / {sum(loads) / len(loads):.1f}")
+
+def batching_sweep(batch_sizes=(1, 8, 32, 128, 512), windows=(1, 4, 16), num_commands=NUM_COMMANDS, seed=0):
+    print("Batch  Window  Clients  Commands/s  p50 (ms)  p99 (ms)")
+    for batch_size in batch_sizes:
+        for window in windows:
+            random.seed(seed)
+            system = PaxosSystem(NUM_NODES, batch_size=batch_size, pipeline_window=window)
+            system.run_pipelined_simulation(num_commands)
+            throughput = system.committed_commands / system.clock * 1000
+            clients = max(NUM_CLIENTS, batch_size * window)
+            print(f"{batch_size:5d}  {window:6d}  {clients:7d}  {throughput:10.0f}  "
+                  f"{system.latency_percentile(50):8.2f}  {system.latency_percentile(99):8.2f}")
+
+def encode_message(kind, sender, ballot, slot, accepted_ballot=-1, value=b""):
+    return FRAME.pack(MESSAGE.size + len(value)) + MESSAGE.pack(kind, sender, ballot, slot, accepted_ballot) + value
+
+def decode_message(body):
+    return MESSAGE.unpack_from(body) + (body[MESSAGE.size:],)
+
+class MemoryChannel:
+    # In-process stand-in for a socket, so transport cost can be separated from protocol cost
+    def __init__(self, inbox, outbox):
+        self.inbox = inbox
+        self.outbox = outbox
+
+    def write(self, frame):
+        self.outbox.put_nowait(frame)
+
+    async def drain(self):
+        pass
+
+    async def read_frame(self):
+        frame = await self.inbox.get()
+        return frame[FRAME.size:]
+
+    @staticmethod
+    def pair():
+        forward, backward = asyncio.Queue(), asyncio.Queue()
+        return MemoryChannel(backward, forward), MemoryChannel(forward, backward)
+
+class TcpChannel:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    async def drain(self):
+        # Waits while the socket's send buffer is over its high-water mark
+        await self.writer.drain()
+
+    async def read_frame(self):
+        header = await self.reader.readexactly(FRAME.size)
+        return await self.reader.readexactly(FRAME.unpack(header)[0])
+
+async def serve_channel(node, channel):
+    # Acceptor side of one pooled connection
+    while True:
         try:
-            with self.lock:
-                message = self.queue.get(timeout=1)  # Simulate network delay
-            self.handle_message(message)
-        except Exception:
-            pass  # Ignore timeouts or other exceptions
-
-    def handle_message(self, message):
-        if message["type"] == PREPARE:
-            self.handle_prepare(message)
-
-    def handle_prepare(self, message):
-        if message["round"] > self.accepted_round:
-            self.accepted_round = message["round"]
-            self.accepted_value = None  # Clear the accepted value
-            response = {
-                "type": PROMISE,
-                "round": self.accepted_round,
-                "node_rank": self.rank,
-                "accepted_value": self.accepted_value,
-            }
-            sender_rank = message["node_rank"]
-            with self.lock:
-                self.queue.put((self.nodes[sender_rank], response))
+            body = await channel.read_frame()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+        kind, sender, ballot, slot, _, value = decode_message(body)
+        if kind == PREPARE:
+            accepted = node.receive_prepare_slots(ballot, slot)
+            if accepted is None:
+                channel.write(encode_message(NACK, node.id, node.promised_id, slot))
+            else:
+                for accepted_slot, (accepted_ballot, accepted_value) in accepted.items():
+                    channel.write(encode_message(PROMISE, node.id, ballot, accepted_slot, accepted_ballot, accepted_value))
+                channel.write(encode_message(PROMISE, node.id, ballot, slot))  # End of this promise
+        elif kind == ACCEPT:
+            if node.receive_accept_slot(ballot, slot, value):
+                channel.write(encode_message(ACCEPTED, node.id, ballot, slot))
+            else:
+                channel.write(encode_message(NACK, node.id, node.promised_id, slot))
+        try:
+            await channel.drain()
+        except ConnectionError:
+            return
 
+def run_acceptor_process(node_id, port):
+    async def serve():
+        node = Node(node_id)
+        server = await asyncio.start_server(
+            lambda reader, writer: serve_channel(node, TcpChannel(reader, writer)), "127.0.0.1", port)
+        async with server:
+            await server.serve_forever()
+    asyncio.run(serve())
 
-if __name__ == "__main__":
-    manager = Manager()
-    queue = manager.Queue()
-    lock = manager.Lock()  # Use a Manager Lock
+class AsyncLeader:
+    def __init__(self, channels, leader_id=0):
+        self.channels = channels
+        self.id = leader_id
+        self.quorum = len(channels) // 2 + 1
+        self.ballot = make_ballot(1, leader_id)
+        self.next_slot = 0
+        self.waiting = {}  # Slot -> [acks, future]
+        self.promises = 0
+        self.promised = None
+        self.previously_accepted = {}
+        self.codec_time = 0
+        self.latencies = []
+
+    async def broadcast(self, kind, slot, value=b""):
+        started = time.perf_counter()
+        frame = encode_message(kind, self.id, self.ballot, slot, -1, value)
+        self.codec_time += time.perf_counter() - started
+        for channel in self.channels:
+            channel.write(frame)
+        for channel in self.channels:
+            await channel.drain()
 
-    N = 5  # Number of Paxos nodes
-    nodes = []
+    async def receive(self, channel):
+        while True:
+            try:
+                body = await channel.read_frame()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            started = time.perf_counter()
+            kind, sender, ballot, slot, accepted_ballot, value = decode_message(body)
+            self.codec_time += time.perf_counter() - started
+            if kind == ACCEPTED:
+                entry = self.waiting.get(slot)
+                if entry is not None:
+                    entry[0] += 1
+                    if entry[0] == self.quorum:
+                        entry[1].set_result(True)
+            elif kind == PROMISE and accepted_ballot >= 0:
+                if slot not in self.previously_accepted or accepted_ballot > self.previously_accepted[slot][0]:
+                    self.previously_accepted[slot] = (accepted_ballot, value)
+            elif kind == PROMISE:
+                self.promises += 1
+                if self.promises == self.quorum:
+                    self.promised.set_result(True)
+            elif kind == NACK:
+                # Someone holds a higher ballot; fail whatever was waiting on this slot
+                entry = self.waiting.pop(slot, None)
+                if entry is not None and not entry[1].done():
+                    entry[1].set_result(False)
+                if self.promised is not None and not self.promised.done():
+                    self.promised.set_result(False)
 
-    with ProcessPoolExecutor() as executor:
-        for i in range(N):
-            node = Node(i, nodes, lock, queue, initial_latency=random.uniform(0.1, 0.5), initial_network_overhead=100)
-            nodes.append(node)
+    async def prepare(self):
+        # Phase 1 once for every slot from next_slot on, then re-propose anything found accepted
+        self.promised = asyncio.get_running_loop().create_future()
+        self.promises = 0
+        await self.broadcast(PREPARE, self.next_slot)
+        if not await self.promised:
+            return False
+        for slot in sorted(self.previously_accepted):
+            self.next_slot = slot
+            await self.propose(self.previously_accepted[slot][1])
+        return True
+
+    async def propose(self, value):
+        slot = self.next_slot
+        self.next_slot += 1
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[slot] = [0, future]
+        started = time.perf_counter()
+        await self.broadcast(ACCEPT, slot, value)
+        chosen = await future
+        self.waiting.pop(slot, None)
+        if chosen:
+            self.latencies.append((time.perf_counter() - started) * 1000)
+        return chosen
+
+    async def client(self, num_commands):
+        for _ in range(num_commands):
+            await self.propose(ASYNC_VALUE)
+
+async def open_channels(num_nodes, transport):
+    # One pooled connection per acceptor, reused for every message
+    channels = []
+    tasks = []
+    for node_id in range(num_nodes):
+        if transport == "memory":
+            leader_side, acceptor_side = MemoryChannel.pair()
+            tasks.append(asyncio.create_task(serve_channel(Node(node_id), acceptor_side)))
+            channels.append(leader_side)
+            continue
+        deadline = time.monotonic() + ASYNC_CONNECT_TIMEOUT
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection("127.0.0.1", ASYNC_BASE_PORT + node_id)
+                break
+            except ConnectionError:
+                if time.monotonic() > deadline:
+                    for channel in channels:
+                        channel.writer.close()
+                    raise ConnectionError(f"Acceptor {node_id} not accepting on port {ASYNC_BASE_PORT + node_id} "
+                                          f"after {ASYNC_CONNECT_TIMEOUT} s")
+                await asyncio.sleep(0.05)  # Acceptor process still starting
+        channels.append(TcpChannel(reader, writer))
+    return channels, tasks
+
+async def run_async_benchmark(num_nodes, transport, num_commands, num_clients):
+    channels, tasks = await open_channels(num_nodes, transport)
+    leader = AsyncLeader(channels)
+    tasks += [asyncio.create_task(leader.receive(channel)) for channel in channels]
+    await leader.prepare()
 
-        futures = []
-        for n in nodes:
-            futures.append(executor.submit(n.run))
-            futures.append(executor.submit(n.handle_messages))
+    started = time.perf_counter()
+    await asyncio.gather(*(leader.client(num_commands // num_clients) for _ in range(num_clients)))
+    elapsed = time.perf_counter() - started
 
-        for f in futures:
-            f.result()
+    for task in tasks:
+        task.cancel()
+    for channel in channels:
+        if isinstance(channel, TcpChannel):
+            channel.writer.close()
+    return leader, elapsed
 
-    for node in nodes:
-        avail = (NUM_MESSAGES - node.failed) / NUM_MESSAGES
-        print(f"Node {node.rank} availability: {avail:.2%}")
+def async_benchmark(transport="memory", num_nodes=NUM_NODES, num_commands=ASYNC_NUM_COMMANDS, num_clients=ASYNC_CLIENTS):
+    processes = []
+    if transport == "tcp":
+        # Each acceptor is its own process with its own event loop
+        for node_id in range(num_nodes):
+            process = multiprocessing.Process(target=run_acceptor_process, args=(node_id, ASYNC_BASE_PORT + node_id), daemon=True)
+            process.start()
+            processes.append(process)
+    try:
+        leader, elapsed = asyncio.run(run_async_benchmark(num_nodes, transport, num_commands, num_clients))
+    finally:
+        for process in processes:
+            process.terminate()
 
-    total_latency = sum(node.latency for node in nodes) / (NUM_MESSAGES * len(nodes))
-    total_network_overhead = sum(node.network_overhead for node in nodes) / (NUM_MESSAGES * len(nodes))
+    latencies = sorted(leader.latencies)
+    count = len(latencies)
+    if not count:
+        print(f"{transport}: no commands committed in {elapsed:.3f} s")
+        return
+    print(f"{transport}: {count / elapsed:.0f} commits/s, "
+          f"p50 {latencies[count // 2]:.3f} ms, p99 {latencies[int(count * 0.99)]:.3f} ms, "
+          f"p99.9 {latencies[int(count * 0.999)]:.3f} ms, "
+          f"leader encode/decode {leader.codec_time / elapsed:.1%} of run time")
 
-    overall_availability = sum(1 for node in nodes if not node.failed) / len(nodes)
-    print(f"Overall Availability: {overall_availability:.3%}")
-    print(f"Total Average Latency: {total_latency:.3f} seconds")
-    print(f"Total Average Network Overhead: {total_network_overhead} bytes")'''
\ No newline at end of file
+if __name__ == "__main__":
+    paxos_system = PaxosSystem(NUM_NODES)
+    paxos_system.run_simulation(NUM_PROPOSALS)
+    paxos_system.print_results()
+    # Benchmarks only run with --benchmarks
+    if "--benchmarks" in sys.argv:
+        compare_modes()
+        batching_sweep()
+        run_event_simulation().print_results()
+        async_benchmark("memory")
+        async_benchmark("tcp")
+        contention_benchmark()
+        quorum_benchmark()
+        log_compaction_benchmark()
+        leaderless_benchmark()
@@ -1,10 +1,30 @@
 import simpy
 import random
+import sys
+from latency import service_time, saturation_sweep
 
 # Constants
 NUM_NODES = 100
 NUM_REPLICA_GROUPS = 10
 NUM_CLIENT_REQUESTS = 10000
+MEAN_TIME_TO_FAILURE = 5000  # Simulated ms a node stays up, on average
+MEAN_TIME_TO_RECOVERY = 500
+STATE_TRANSFER_SETUP = 5  # ms to start copying state from the tail to a rejoining node
+STATE_BYTES_PER_WRITE = 64
+TRANSFER_BANDWIDTH = 125000  # Bytes per ms
+NUM_CLIENTS = 50
+ARRIVAL_RATE = 1.0  # Writes per ms across all clients (open loop)
+MIN_HOP_DELAY = 0.5  # ms per hop, head to tail and tail back to the client
+MAX_HOP_DELAY = 1.0
+SERVICE_TIME = 0.05  # Mean ms a replica spends applying and forwarding one write
+HEAD_SERVICE_TIME = 0.2  # The head also handles the client and orders writes
+NODE_CONCURRENCY = 1  # Requests a replica works on at once; the rest queue
+SWEEP_TIME = 2000
+READ_RATIO = 0.5  # Fraction of client requests that are reads
+NUM_KEYS = 1000
+CRAQ = False  # Serve reads at any replica instead of only at the tail
+VERSION_QUERY_TIME = 0.02  # ms the tail spends answering a version query for a dirty object
+CRAQ_TIME = 500
 
 class Node:
     def __init__(self, id, group):
@@ -13,82 +33,293 @@ class Node:
         self.failed = False
         self.requests_handled = 0
         self.next = None
+        self.prev = None
+        self.in_chain = False
+        self.server = None  # NODE_CONCURRENCY requests at a time, set up once there is an environment
+        self.busy_time = 0
+        self.dirty = {}  # Key -> versions seen here but not yet committed by the tail (CRAQ)
+        self.reads_served = 0
+        self.version_queries = 0
+
+class Chain:
+    # Doubly linked so a failed node can be spliced out, and a recovered one added, in O(1)
+    def __init__(self):
+        self.head = None
+        self.tail = None
+        self.length = 0
+        self.writes = 0  # Writes applied, which is the state a rejoining node has to copy
+
+    def append(self, node):
+        node.prev = self.tail
+        node.next = None
+        if self.tail:
+            self.tail.next = node
+        else:
+            self.head = node
+        self.tail = node
+        self.length += 1
+        node.in_chain = True
+
+    def remove(self, node):
+        if node.prev:
+            node.prev.next = node.next
+        else:
+            self.head = node.next
+        if node.next:
+            node.next.prev = node.prev
+        else:
+            self.tail = node.prev
+        node.prev = node.next = None
+        self.length -= 1
+        node.in_chain = False
+
+    def random_node(self):
+        node = self.head
+        for _ in range(random.randrange(self.length)):
+            node = node.next
+        return node
+
+    def __iter__(self):
+        node = self.head
+        while node:
+            yield node
+            node = node.next
 
 class ChainReplication:
 
-    def __init__(self, env, nodes):
+    def __init__(self, env, nodes, num_groups=NUM_REPLICA_GROUPS, arrival_rate=ARRIVAL_RATE, failures=True,
+                 read_ratio=READ_RATIO, craq=CRAQ):
         self.env = env
         self.nodes = nodes
-        self.chains = [[] for _ in range(NUM_REPLICA_GROUPS)]
-        self.latency = {}  # dict to store latencies
+        self.num_groups = num_groups
+        self.arrival_rate = arrival_rate
+        self.chains = [Chain() for _ in range(num_groups)]
+        self.read_ratio = read_ratio
+        self.craq = craq
+        self.latency = []
+        self.read_latency = []
+        self.dirty_reads = 0
+        self.issued = [0] * num_groups
+        self.dropped = 0
         self.total_network_overhead = 0
+        self.state_transfers = 0
+        self.total_transfer_time = 0
+        for node in self.nodes:
+            node.server = simpy.Resource(env, capacity=NODE_CONCURRENCY)
         self.construct_chains()
-        self.env.process(self.run())
-        
+        for _ in range(NUM_CLIENTS):
+            self.env.process(self.client())
+        if failures:
+            for node in self.nodes:
+                self.env.process(self.lifecycle(node))
 
     def construct_chains(self):
         for node in self.nodes:
-            chain = self.chains[node.group]
-            if chain:
-                chain[-1].next = node
-            chain.append(node)
-
-    def reconstruct(self):
-        for chain in self.chains:
-            chain[:] = [n for n in chain if not n.failed]
-            for i in range(len(chain) - 1):
-                chain[i].next = chain[i+1]
-            if chain:
-                chain[-1].next = None
-
-    def run(self):
-        for _ in range(NUM_CLIENT_REQUESTS):
-            # Simulate request
-            request_time = self.env.now
-            group = random.randint(0, NUM_REPLICA_GROUPS - 1)
-            chain = self.chains[group]
-            if chain:
-                head = chain[0]
-                tail = chain[-1]
-                if not head.failed and not tail.failed:
-                    latency = random.uniform(1, 10)
-                    yield self.env.timeout(latency)
-                    self.latency[request_time] = self.env.now - request_time
-                    tail.requests_handled += 1
-                    
-                    # Simulate network overhead
-                    network_overhead = random.uniform(0.1, 1.0)
-                    self.total_network_overhead += network_overhead
-
-            # Check for failures
-            for node in self.nodes:
-                if random.random() < 0.001:  # 0.1% chance of failure
-                    node.failed = True
-                elif node.failed and random.random() < 0.01:  # 1% chance of recovery
-                    node.failed = False
-            self.reconstruct()
-
-# Simulation    
-env = simpy.Environment()
-nodes = [Node(i, i % NUM_REPLICA_GROUPS) for i in range(NUM_NODES)]
-chain = ChainReplication(env, nodes)
-env.run(until=NUM_CLIENT_REQUESTS)
-
-# Calculate availability per replica group
-# Calculate availability per replica group
-availability_per_group = [
-    sum(n.requests_handled for n in chain.chains[group]) / NUM_CLIENT_REQUESTS
-    for group in range(NUM_REPLICA_GROUPS)
-]
-
-# Stats
-total_latency = sum(chain.latency.values())
-average_latency = total_latency / len(chain.latency) if chain.latency else 0
-availability = sum(availability_per_group) / NUM_REPLICA_GROUPS
-average_network_overhead = chain.total_network_overhead / NUM_CLIENT_REQUESTS
-
-print(f"1. Average Latency: {average_latency:.3f} ms")
-print(f"2. Availability: {availability* 100:.2%}")
-print(f"3. Availability per Replica Group: {[f'{a:.2%}' for a in availability_per_group]}")
-print(f"4. Average Network Overhead per Request: {average_network_overhead:.6f} MB")
+            self.chains[node.group].append(node)
+
+    def lifecycle(self, node):
+        # Failures and recoveries are events that repair only the chain they touch
+        while True:
+            yield self.env.timeout(random.expovariate(1 / MEAN_TIME_TO_FAILURE))
+            node.failed = True
+            self.chains[node.group].remove(node)
+            yield self.env.timeout(random.expovariate(1 / MEAN_TIME_TO_RECOVERY))
+            node.failed = False
+            yield from self.rejoin(node)
+
+    def rejoin(self, node):
+        # A recovered node copies the group's state from the current tail, then becomes the new tail
+        chain = self.chains[node.group]
+        transfer_time = STATE_TRANSFER_SETUP + chain.writes * STATE_BYTES_PER_WRITE / TRANSFER_BANDWIDTH
+        yield self.env.timeout(transfer_time)
+        node.dirty = {}  # The copy came from the tail, so everything on it is committed
+        chain.append(node)
+        self.state_transfers += 1
+        self.total_transfer_time += transfer_time
+
+    def client(self):
+        # Open loop: writes are issued on a Poisson schedule whether or not earlier ones finished
+        while True:
+            yield self.env.timeout(random.expovariate(self.arrival_rate / NUM_CLIENTS))
+            group = random.randint(0, self.num_groups - 1)
+            key = random.randint(0, NUM_KEYS - 1)
+            if random.random() < self.read_ratio:
+                self.env.process(self.read(group, key))
+                continue
+            self.issued[group] += 1
+            self.env.process(self.write(group, key))
+
+    def hop(self):
+        return self.env.timeout(random.uniform(MIN_HOP_DELAY, MAX_HOP_DELAY))
+
+    def write(self, group, key):
+        # The write is applied at each replica in turn and forwarded down next; many writes can be
+        # in flight along one chain, each waiting only for the replica it is at
+        request_time = self.env.now
+        chain = self.chains[group]
+        node = chain.head
+        previous = None
+        while True:
+            if node is None or node.failed:
+                if previous is not None and not previous.failed:
+                    node = previous.next  # The predecessor resends to its new successor
+                    if node is None:
+                        node = previous  # The predecessor is the tail now, so the write is complete
+                        break
+                else:
+                    node = chain.head  # The client retries at the head
+                    previous = None
+                    if node is None:
+                        self.dropped += 1
+                        return
+                continue
+
+            with node.server.request() as request:
+                yield request
+                busy = service_time(HEAD_SERVICE_TIME if node is chain.head else SERVICE_TIME)
+                yield self.env.timeout(busy)
+                node.busy_time += busy
+            if node.failed:
+                continue
+            if node is chain.tail:
+                break
+            if self.craq:
+                node.dirty[key] = node.dirty.get(key, 0) + 1
+            previous = node
+            node = node.next
+            yield self.hop()
+
+        if self.craq:
+            self.env.process(self.commit(node, key))
+        yield self.hop()  # The tail acknowledges the client
+        node.requests_handled += 1
+        chain.writes += 1
+        self.latency.append(self.env.now - request_time)
+
+        # Simulate network overhead
+        network_overhead = random.uniform(0.1, 1.0)
+        self.total_network_overhead += network_overhead
+
+    def commit(self, tail, key):
+        # The tail's commit travels back up the chain, marking the version clean at each replica
+        node = tail.prev
+        while node:
+            yield self.hop()
+            if node.dirty.get(key):
+                node.dirty[key] -= 1
+            node = node.prev
+
+    def read(self, group, key):
+        # Tail-only reads in plain chain replication; with CRAQ any replica answers a clean read,
+        # and a dirty one costs a version query to the tail
+        request_time = self.env.now
+        chain = self.chains[group]
+        if chain.tail is None:
+            self.dropped += 1
+            return
+        node = chain.random_node() if self.craq else chain.tail
+        yield self.hop()
+        with node.server.request() as request:
+            yield request
+            busy = service_time(SERVICE_TIME)
+            yield self.env.timeout(busy)
+            node.busy_time += busy
+        node.reads_served += 1
+
+        tail = chain.tail
+        if self.craq and node.dirty.get(key) and tail is not None and node is not tail:
+            self.dirty_reads += 1
+            yield self.hop()
+            with tail.server.request() as request:
+                yield request
+                busy = service_time(VERSION_QUERY_TIME)
+                yield self.env.timeout(busy)
+                tail.busy_time += busy
+            tail.version_queries += 1
+            yield self.hop()
+
+        yield self.hop()
+        self.read_latency.append(self.env.now - request_time)
+
+def craq_comparison(read_ratios=(0.5, 0.9, 0.99), read_load=30, write_load=4, length=5):
+    # One failure-free chain offered enough reads to saturate a tail serving every read, with the
+    # total scaled per read ratio so writes stay below what the head can serve (1 / HEAD_SERVICE_TIME)
+    print("Mode        Reads  Offered  Read Throughput  Read Latency (ms)  Dirty Reads  Reads per Node (head..tail)")
+    for read_ratio in read_ratios:
+        offered_load = min(read_load / read_ratio, write_load / (1 - read_ratio))
+        for craq in (False, True):
+            random.seed(0)
+            craq_env = simpy.Environment()
+            craq_nodes = [Node(i, 0) for i in range(length)]
+            system = ChainReplication(craq_env, craq_nodes, num_groups=1, arrival_rate=offered_load,
+                                      failures=False, read_ratio=read_ratio, craq=craq)
+            craq_env.run(until=CRAQ_TIME)
+            reads = len(system.read_latency)
+            average = sum(system.read_latency) / reads if reads else 0
+            print(f"{'CRAQ' if craq else 'tail-only':10s}  {read_ratio:5.0%}  {offered_load:7.1f}  {reads / CRAQ_TIME:15.2f}  "
+                  f"{average:17.2f}  {system.dirty_reads / max(reads, 1):11.2%}  "
+                  f"{[node.reads_served for node in craq_nodes]}")
+
+def chain_length_sweep(lengths=(2, 4, 8, 16), offered_loads=(1, 2, 4, 8)):
+    # One failure-free chain per run; writes/ms completed against writes/ms offered. Once the
+    # head is saturated its utilization reaches 1 and throughput stops following the offered load.
+    print("Length  Offered  Throughput  Latency (ms)  Head Util  Tail Util")
+    for length in lengths:
+        for offered_load in offered_loads:
+            random.seed(0)
+            sweep_env = simpy.Environment()
+            sweep_nodes = [Node(i, 0) for i in range(length)]
+            system = ChainReplication(sweep_env, sweep_nodes, num_groups=1, arrival_rate=offered_load,
+                                      failures=False, read_ratio=0)
+            sweep_env.run(until=SWEEP_TIME)
+            completed = len(system.latency)
+            average = sum(system.latency) / completed if completed else 0
+            print(f"{length:6d}  {offered_load:7.1f}  {completed / SWEEP_TIME:10.2f}  {average:12.2f}  "
+                  f"{sweep_nodes[0].busy_time / SWEEP_TIME / NODE_CONCURRENCY:9.2f}  "
+                  f"{sweep_nodes[-1].busy_time / SWEEP_TIME / NODE_CONCURRENCY:9.2f}")
+
+def load_sweep(offered_loads=(1, 2, 3, 4, 4.5, 5, 6), length=5):
+    # Write-only, failure-free chain
+    def run(offered_load):
+        sweep_env = simpy.Environment()
+        sweep_nodes = [Node(i, 0) for i in range(length)]
+        system = ChainReplication(sweep_env, sweep_nodes, num_groups=1, arrival_rate=offered_load,
+                                  failures=False, read_ratio=0)
+        sweep_env.run(until=SWEEP_TIME)
+        return system.latency, SWEEP_TIME
+    saturation_sweep(offered_loads, run, "writes")
+
+if __name__ == "__main__":
+    # Simulation    
+    env = simpy.Environment()
+    nodes = [Node(i, i % NUM_REPLICA_GROUPS) for i in range(NUM_NODES)]
+    chain = ChainReplication(env, nodes)
+    env.run(until=NUM_CLIENT_REQUESTS)
+
+    # Calculate availability per replica group
+    availability_per_group = [
+        sum(n.requests_handled for n in nodes if n.group == group) / max(chain.issued[group], 1)
+        for group in range(NUM_REPLICA_GROUPS)
+    ]
+
+    # Stats
+    completed = len(chain.latency)
+    total_latency = sum(chain.latency)
+    average_latency = total_latency / completed if completed else 0
+    availability = sum(availability_per_group) / NUM_REPLICA_GROUPS
+    average_network_overhead = chain.total_network_overhead / max(completed, 1)
+
+    print(f"1. Average Latency: {average_latency:.3f} ms")
+    print(f"2. Availability: {availability:.2%}")
+    print(f"3. Availability per Replica Group: {[f'{a:.2%}' for a in availability_per_group]}")
+    print(f"4. Average Network Overhead per Request: {average_network_overhead:.6f} MB")
+    print(f"5. State Transfers: {chain.state_transfers}, "
+          f"average {chain.total_transfer_time / max(chain.state_transfers, 1):.3f} ms")
+    print(f"6. Throughput: {completed / NUM_CLIENT_REQUESTS:.3f} writes/ms, {chain.dropped} dropped")
+    print(f"7. Average Read Latency: {sum(chain.read_latency) / max(len(chain.read_latency), 1):.3f} ms")
 
+    # Sweeps only run with --benchmarks
+    if "--benchmarks" in sys.argv:
+        chain_length_sweep()
+        craq_comparison()
+        load_sweep()
@@ -1,49 +1,629 @@
+import bisect
+import hashlib
+import itertools
 import random
+import sys
 import time
+from array import array
+from collections import OrderedDict
+
+import numpy as np
 
 # Constants
 NUM_NODES = 10
 NUM_GROUPS = 3
 NUM_OPERATIONS = 1000
+BATCH_SIZE = 100
 FAILURE_RATE = 0.01
 RECOVERY_RATE = 0.1
+BITS = 160  # Number of bits for the Chord ring (SHA-1)
+RING_SIZE = 2 ** BITS
+VNODES_PER_NODE = 8  # Virtual nodes placed on the ring by each physical node
+STABILIZE_INTERVAL = 10  # Each node runs stabilize/fix_fingers about once per this many steps
+ARRIVAL_RATE = 0.05  # Physical nodes joining per unit time under churn
+DEPARTURE_RATE = 0.05  # Physical nodes leaving per unit time under churn
+GRACEFUL_LEAVE_PROBABILITY = 0.5  # The rest of the departures are crashes
+LOOKUPS_PER_STEP = 10
+REPLICATION_FACTOR = 1  # Copies of each key, kept on the owner and its next successors
+CACHE_SIZE = 0  # Entries in each node's LRU key -> owner cache, 0 disables it
+KEY_SKEW = 0  # Zipf exponent of the workload's key popularity, 0 for uniform keys
+KEY_BYTES = 8  # Keys travel and are stored as 64-bit ints
+ID_BYTES = BITS // 8  # Size of a ring identifier in a lookup message
+PREFIX_SHIFT = BITS - 64  # Batch owner lookups search the top 64 bits of each id
+STORAGE_MERGE_RATIO = 8  # Storage folds pending inserts and pops into its arrays at 1/8 of its size
+STORAGE_BULK_UPDATE = 64  # Storage.update batches this large find their slots in one vectorized search
+TOMBSTONE = object()  # Marks a popped Storage slot until the next merge
 
-class Node:
+def hash_id(value):
+    return int.from_bytes(hashlib.sha1(str(value).encode()).digest(), "big") % RING_SIZE
+
+def hash_prefixes(values):
+    # Top 64 bits of hash_id for each value as a uint64 array; hash_id keeps the whole 160-bit digest,
+    # so those are its first 8 bytes
+    digests = b"".join(hashlib.sha1(str(value).encode()).digest()[:8] for value in values)
+    return np.frombuffer(digests, dtype=">u8").astype(np.uint64)
+
+def distinct_hosts(nodes, count):
+    # The first count nodes that sit on different physical hosts, so their copies do not fail together
+    chosen = []
+    hosts = set()
+    for node in nodes:
+        if node.host not in hosts:
+            hosts.add(node.host)
+            chosen.append(node)
+            if len(chosen) == count:
+                break
+    return chosen
+
+def append_indexed(items, item):
+    item.slot = len(items)
+    items.append(item)
+
+def remove_indexed(items, item):
+    # O(1) removal by swapping the last item into the freed slot
+    last = items.pop()
+    if last is not item:
+        items[item.slot] = last
+        last.slot = item.slot
+
+def value_size(value):
+    return len(value) if isinstance(value, (str, bytes)) else len(str(value))
+
+def intern_value(value):
+    # Copies of the same string value share one object
+    return sys.intern(value) if isinstance(value, str) else value
+
+def in_interval(x, a, b, inclusive=True):
+    # Is x in (a, b] (or (a, b) if not inclusive), handling the wrap-around case
+    if a < b:
+        return a < x < b or (inclusive and x == b)
+    return x > a or x < b or (inclusive and x == b)
+
+class Storage:
+    # Sorted array of int keys with a parallel list of interned values, 16 bytes per merged key plus a
+    # fixed per-store overhead. Small stores insert in place; in larger ones new keys land in a dict and
+    # pops leave tombstones, and both are folded into the arrays once they reach 1/STORAGE_MERGE_RATIO
+    # of the store, so each costs O(1) amortized.
+    def __init__(self):
+        self.keys = array("q")
+        self.values = []
+        self.pending = {}  # New keys not merged into the arrays yet
+        self.tombstones = set()  # Array slots popped since the last merge
+
+    def find(self, key):
+        i = bisect.bisect_left(self.keys, key)
+        return i, i < len(self.keys) and self.keys[i] == key
+
+    def get(self, key, default=None):
+        value = self.pending.get(key, TOMBSTONE)
+        if value is TOMBSTONE:
+            i, found = self.find(key)
+            if found:
+                value = self.values[i]
+        return default if value is TOMBSTONE else value
+
+    def __setitem__(self, key, value):
+        value = intern_value(value)
+        i, found = self.find(key)
+        if found:
+            if self.values[i] is TOMBSTONE:
+                self.tombstones.discard(i)
+            self.values[i] = value
+        elif len(self.keys) < STORAGE_BULK_UPDATE and not self.tombstones:
+            self.keys.insert(i, key)
+            self.values.insert(i, value)
+        else:
+            self.pending[key] = value
+            self.maybe_merge()
+
+    def __contains__(self, key):
+        return self.get(key, TOMBSTONE) is not TOMBSTONE
+
+    def __len__(self):
+        return len(self.keys) - len(self.tombstones) + len(self.pending)
+
+    def __iter__(self):
+        return (key for key, _ in self.items())
+
+    def items(self):
+        merged = ((key, value) for key, value in zip(self.keys.tolist(), self.values) if value is not TOMBSTONE)
+        return itertools.chain(merged, list(self.pending.items()))
+
+    def update(self, items):
+        items = list(items.items() if hasattr(items, "items") else items)
+        if len(items) < STORAGE_BULK_UPDATE:
+            for key, value in items:
+                self[key] = value
+            return
+        # Large batches find their existing slots with one vectorized search; the rest go to pending
+        keys, values = zip(*items)
+        keys = np.array(keys, dtype=np.int64)
+        values = list(map(intern_value, values))
+        stored = np.array(self.keys, dtype=np.int64)
+        positions = np.searchsorted(stored, keys)
+        found = positions < len(stored)
+        found[found] = stored[positions[found]] == keys[found]
+        for j, i in zip(np.flatnonzero(found).tolist(), positions[found].tolist()):
+            self.values[i] = values[j]
+            self.tombstones.discard(i)
+        keys = keys.tolist()
+        if found.any():
+            self.pending.update((keys[j], values[j]) for j in np.flatnonzero(~found).tolist())
+        else:
+            self.pending.update(zip(keys, values))
+        self.maybe_merge()
+
+    def pop(self, key):
+        if key in self.pending:
+            return self.pending.pop(key)
+        i, found = self.find(key)
+        if not found or self.values[i] is TOMBSTONE:
+            raise KeyError(key)
+        value = self.values[i]
+        self.values[i] = TOMBSTONE
+        self.tombstones.add(i)
+        self.maybe_merge()
+        return value
+
+    def maybe_merge(self):
+        if len(self.pending) + len(self.tombstones) > len(self.keys) // STORAGE_MERGE_RATIO:
+            self.merge()
+
+    def merge(self):
+        keys = np.array(self.keys, dtype=np.int64)
+        values = self.values
+        if self.tombstones:
+            kept = np.ones(len(keys), dtype=bool)
+            kept[list(self.tombstones)] = False
+            keys = keys[kept]
+            values = [value for value in values if value is not TOMBSTONE]
+        keys = np.concatenate((keys, np.fromiter(self.pending, dtype=np.int64, count=len(self.pending))))
+        values += self.pending.values()
+        order = np.argsort(keys, kind="stable")
+        self.keys = array("q", keys[order].tobytes())
+        self.values = [values[i] for i in order.tolist()]
+        self.pending = {}
+        self.tombstones = set()
+
+    def memory(self):
+        return (sys.getsizeof(self.keys) + sys.getsizeof(self.values)
+                + sys.getsizeof(self.pending) + sys.getsizeof(self.tombstones))
+
+class Host:
+    # A physical node; it fails and recovers together with all of its virtual nodes
     def __init__(self, id, group):
         self.id = id
         self.group = group
+        self.failed = False
+        self.vnodes = []
+        self.requests_handled = 0
+
+    def stored_keys(self):
+        return sum(len(vnode.data) for vnode in self.vnodes)
+
+class Node:
+    def __init__(self, id, host, num_successors=REPLICATION_FACTOR, cache_size=CACHE_SIZE):
+        self.id = id  # Position on the ring
+        self.host = host
+        self.num_successors = num_successors
+        self.cache_size = cache_size
+        self.location_cache = OrderedDict() if cache_size > 0 else None  # Key id -> owner, LRU order
         self.successor = None
+        self.successor_list = []  # The next num_successors nodes, successor first, kept by stabilization
         self.predecessor = None
-        self.failed = False
-        self.data = {}
+        self.fingers = []  # Distinct successor(id + 2^i) nodes, nearest first
+        self.next_finger = 0  # Exponent fix_fingers refreshes next
+        self.new_fingers = []  # Finger table being rebuilt by fix_fingers
+        self.joined = True  # False while the node has lost its place in the ring
+        self.left = False
+        self.data = Storage()
+        self.replica_data = Storage()  # Copies of keys owned by the preceding nodes
+
+    @property
+    def group(self):
+        return self.host.group
+
+    @property
+    def failed(self):
+        return self.left or self.host.failed
+
+    @property
+    def active(self):
+        # Can take part in routing and stabilization
+        return self.joined and not self.failed
+
+    def finger_start(self, i):
+        return (self.id + 2 ** i) % RING_SIZE
+
+    def set_successor(self, node):
+        # Keeps the successor list entries that lie beyond the new successor
+        self.successor = node
+        beyond = [n for n in self.successor_list if n is not node and in_interval(n.id, node.id, self.id, inclusive=False)]
+        self.successor_list = [node] + beyond[:self.num_successors - 1]
+
+    def closest_preceding_node(self, key):
+        # Both the finger table and the successor list are searched, so failed successors are skipped
+        best = self
+        for candidates in (self.fingers, self.successor_list):
+            for node in reversed(candidates):
+                if node.active and in_interval(node.id, self.id, key, inclusive=False):
+                    if best is self or in_interval(node.id, best.id, key, inclusive=False):
+                        best = node
+                    break
+        return best
+
+    def find_predecessor(self, key):
+        # Iterative lookup, returns the node preceding key and the number of hops taken
+        if not self.active:
+            return None, 0
+        node = self
+        hops = 0
+        while not in_interval(key, node.id, node.successor.id):
+            next_node = node.closest_preceding_node(key)
+            if next_node is node:
+                next_node = node.successor
+            if not next_node.active:
+                return None, hops
+            node = next_node
+            hops += 1
+        return node, hops
+
+    def lookup(self, key):
+        # Returns the owner of key and the number of hops taken
+        node, hops = self.find_predecessor(key)
+        return (node.successor if node else None), hops
+
+    def responsible_for(self, key):
+        return self.active and self.predecessor is not None and in_interval(key, self.predecessor.id, self.id)
+
+    def cached_owner(self, key):
+        # Returns the cached owner of key, dropping the entry if ownership has moved since
+        owner = self.location_cache.get(key)
+        if owner is None:
+            return None, False
+        if owner.responsible_for(key):
+            self.location_cache.move_to_end(key)
+            return owner, False
+        del self.location_cache[key]
+        return None, True
+
+    def cache_owner(self, key, owner):
+        self.location_cache[key] = owner
+        self.location_cache.move_to_end(key)
+        if len(self.location_cache) > self.cache_size:
+            self.location_cache.popitem(last=False)
 
     def find_successor(self, key):
-        if not self.failed:
-            # Adjust the range check to correctly handle the wrap-around case
-            if self.id < key <= self.successor.id or (self.id > self.successor.id and (key > self.id or key <= self.successor.id)):
-                return self.successor
-            else:
-                return self.successor.find_successor(key)
-        return None
+        return self.lookup(key)[0]
+
+    def join(self, bootstrap):
+        self.predecessor = None
+        self.fingers = []
+        self.new_fingers = []
+        self.next_finger = 0
+        self.successor_list = []
+        if bootstrap is None:
+            self.set_successor(self)  # First node of a new ring
+            self.joined = True
+            return
+        successor = bootstrap.find_successor((self.id + 1) % RING_SIZE)  # Not self when rejoining
+        self.joined = successor is not None and successor is not self and not successor.failed
+        # If the lookup failed the node retries the join when it next stabilizes
+        self.set_successor(successor if self.joined else self)
+        self.fingers = [successor] if self.joined else []
+
+    def stabilize(self):
+        # A successor that is up but rejoining still counts; only failed nodes are dropped
+        if not self.joined:
+            return
+        if self.successor.failed:
+            self.set_successor(next((n for n in self.successor_list + self.fingers if not n.failed), self))
+            if self.successor is self:
+                self.joined = False  # Every known successor is gone, the node has to rejoin
+                return
+        x = self.successor.predecessor
+        if x is not None and not x.failed and in_interval(x.id, self.id, self.successor.id, inclusive=False):
+            self.set_successor(x)
+        self.successor.notify(self)
+        if self.successor.joined:
+            # Refresh the successor list from the successor's own list
+            beyond = [n for n in self.successor.successor_list if n is not self and n is not self.successor]
+            self.successor_list = [self.successor] + beyond[:self.num_successors - 1]
+
+    def check_successor(self, bootstrap):
+        # Looks its own successor up through another node; a closer one found there also merges rings that split apart
+        if not self.joined or bootstrap is None or bootstrap is self:
+            return
+        successor = bootstrap.find_successor((self.id + 1) % RING_SIZE)
+        if (successor is not None and successor is not self and not successor.failed
+                and in_interval(successor.id, self.id, self.successor.id, inclusive=False)):
+            self.set_successor(successor)
+        if self.predecessor is None or self.predecessor.successor is not self:
+            # Nothing links here, so no lookup can reach this node; announce it to the node preceding its id
+            node, _ = bootstrap.find_predecessor(self.id)
+            if node is not None and node is not self and in_interval(self.id, node.id, node.successor.id, inclusive=False):
+                node.set_successor(self)
+
+    def notify(self, node):
+        if node is self:
+            return
+        if not self.joined:
+            # A live node that lost its successors is linked back in by the predecessor still pointing at it
+            successor = next((n for n in node.successor_list if n is not self and n.active), node)
+            self.set_successor(successor)
+            self.fingers = [successor]
+            self.joined = True
+        if self.predecessor is None or self.predecessor.failed or in_interval(node.id, self.predecessor.id, self.id, inclusive=False):
+            self.predecessor = node
+            # Hand over the keys that now belong to the new predecessor
+            for key in [k for k in self.data if not in_interval(hash_id(k), node.id, self.id)]:
+                node.data[key] = self.data.pop(key)
+
+    def check_predecessor(self):
+        if self.predecessor is not None and self.predecessor.failed:
+            self.predecessor = None
+        elif (self.joined and self.predecessor is not None and self.predecessor.joined
+                and in_interval(self.id, self.predecessor.id, self.predecessor.successor.id, inclusive=False)):
+            # The predecessor's successor pointer skips this node; point it back here
+            self.predecessor.set_successor(self)
+
+    def fix_fingers(self):
+        # Resolves one distinct finger per call and swaps in the new table once it is complete
+        finger = self.find_successor(self.finger_start(self.next_finger))
+        if finger is None or not finger.active:
+            return
+        if self.next_finger == 0 and in_interval(finger.id, self.id, self.successor.id, inclusive=False):
+            self.set_successor(finger)  # The first finger is the successor, as in the Chord paper
+        if finger is not self:
+            self.new_fingers.append(finger)
+            self.next_finger = ((finger.id - self.id) % RING_SIZE).bit_length()
+        if finger is self or self.next_finger >= BITS:
+            self.fingers = self.new_fingers
+            self.new_fingers = []
+            self.next_finger = 0
 
 
 
 class ChordRing:
-    def __init__(self, num_nodes, num_groups):
+    def __init__(self, num_nodes, num_groups, vnodes=VNODES_PER_NODE, replicas=REPLICATION_FACTOR,
+                 cache_size=CACHE_SIZE, key_skew=KEY_SKEW, use_index=False, verify_routing=False, stabilize=False):
+        self.num_groups = num_groups
+        self.replicas = replicas
+        self.cache_size = cache_size
+        # Cumulative Zipf weights over keys 0..1000
+        self.key_weights = list(itertools.accumulate(1 / (k + 1) ** key_skew for k in range(1001))) if key_skew > 0 else None
+        self.next_host_id = num_nodes
+        self.vnodes = vnodes
+        # Stabilization keeps about log2 N successors, and enough to reach replicas distinct hosts past
+        # the other vnodes of one host
+        self.num_successors = max(replicas + vnodes - 1, (num_nodes * vnodes).bit_length())
+        self.use_index = use_index  # Resolve owners from the sorted index instead of routing
+        self.verify_routing = verify_routing  # Check every routed lookup against the index
+        self.stabilize = stabilize  # Also stabilize during put/get runs; churn runs always do
+        self.hosts = []
         self.nodes = []
         for i in range(num_nodes):
-            node = Node(i, f"Group{i % num_groups}")
-            self.nodes.append(node)
+            host = Host(i, f"Group{i % num_groups}")
+            append_indexed(self.hosts, host)
+            for v in range(vnodes):
+                node = Node(hash_id(f"{i}#{v}"), host, self.num_successors, cache_size)
+                host.vnodes.append(node)
+                append_indexed(self.nodes, node)
         
-        # Set up the ring
-        for i in range(num_nodes):
-            self.nodes[i].successor = self.nodes[(i + 1) % num_nodes]
-            self.nodes[i].predecessor = self.nodes[(i - 1) % num_nodes]
+        # Set up the ring in identifier order
+        ring = sorted(self.nodes, key=lambda n: n.id)
+        for i in range(len(ring)):
+            ring[i].successor = ring[(i + 1) % len(ring)]
+            ring[i].successor_list = [ring[(i + j) % len(ring)] for j in range(1, min(self.num_successors, len(ring) - 1) + 1)]
+            ring[i].predecessor = ring[(i - 1) % len(ring)]
+
+        # Sorted index of live node ids, kept in sync on join, leave, failure and recovery
+        self.ring_ids = [n.id for n in ring]
+        self.ring_nodes = ring
+        self.ring_prefixes = None  # uint64 top bits of ring_ids, rebuilt lazily after changes
+        for node in self.nodes:
+            self.build_finger_table(node)
 
         self.total_operations = 0
         self.successful_operations = 0
         self.total_latency = 0
-        
+        self.total_lookups = 0
+        self.total_hops = 0
+        self.routing_mismatches = 0
+        self.stabilize_credit = 0
+        self.churn_lookups = 0
+        self.churn_lookup_successes = 0
+        self.replication_messages = 0
+        self.replication_bytes = 0
+        self.network_bytes = 0  # Every put, get, replication and routing message, counted as it is sent
+        self.failover_reads = 0
+        self.gets = 0
+        self.get_hits = 0
+        self.cache_hits = 0
+        self.cache_invalidations = 0
+
+    def index_add(self, node):
+        i = bisect.bisect_left(self.ring_ids, node.id)
+        self.ring_ids.insert(i, node.id)
+        self.ring_nodes.insert(i, node)
+        self.ring_prefixes = None
+
+    def index_remove(self, node):
+        i = bisect.bisect_left(self.ring_ids, node.id)
+        if i < len(self.ring_ids) and self.ring_nodes[i] is node:
+            del self.ring_ids[i]
+            del self.ring_nodes[i]
+            self.ring_prefixes = None
+
+    def owner(self, key):
+        # First live node clockwise from key, in O(log N)
+        if not self.ring_ids:
+            return None
+        return self.ring_nodes[bisect.bisect_left(self.ring_ids, key) % len(self.ring_ids)]
+
+    def owner_positions(self, keys, key_prefixes):
+        # Vectorized owner(): positions in ring_nodes for a whole batch of keys, searched on 64-bit id
+        # prefixes; only keys whose prefix equals a node's fall back to comparing full ids
+        if self.ring_prefixes is None:
+            self.ring_prefixes = np.array([node_id >> PREFIX_SHIFT for node_id in self.ring_ids], dtype=np.uint64)
+        positions = np.searchsorted(self.ring_prefixes, key_prefixes)
+        inside = positions < len(self.ring_ids)
+        ties = np.flatnonzero(inside)[self.ring_prefixes[positions[inside]] == key_prefixes[inside]]
+        for i in ties.tolist():
+            positions[i] = bisect.bisect_left(self.ring_ids, hash_id(keys[i]))
+        return positions % len(self.ring_ids)
+
+    def group_by_owner(self, keys):
+        # Yields (owner position, indices into keys) once per owner node
+        positions = self.owner_positions(keys, hash_prefixes(keys))
+        order = np.argsort(positions, kind="stable")
+        owners, starts = np.unique(positions[order], return_index=True)
+        return zip(owners, np.split(order, starts[1:]))
+
+    def replica_positions(self, position):
+        # The owner and the next successors on other hosts
+        positions = []
+        hosts = set()
+        for j in range(len(self.ring_nodes)):
+            i = (position + j) % len(self.ring_nodes)
+            if self.ring_nodes[i].host not in hosts:
+                hosts.add(self.ring_nodes[i].host)
+                positions.append(i)
+                if len(positions) == self.replicas:
+                    break
+        return positions
+
+    def build_finger_table(self, node):
+        # Consecutive fingers mostly point at the same node, so only distinct ones are kept
+        node.fingers = []
+        i = 0
+        while i < BITS:
+            finger = self.owner(node.finger_start(i))
+            if finger is None or finger is node:
+                break
+            node.fingers.append(finger)
+            i = ((finger.id - node.id) % RING_SIZE).bit_length()  # First start past this finger
+
+    def bootstrap_node(self):
+        # A random joined node to join through, or None to re-form the ring when none is left
+        for _ in range(8):
+            if not self.ring_nodes:
+                return None
+            node = random.choice(self.ring_nodes)
+            if node.active:
+                return node
+        return next((node for node in self.ring_nodes if node.active), None)
+
+    def join(self, node):
+        # The node only learns its successor; stabilization links it into the ring
+        node.join(self.bootstrap_node())
+        append_indexed(self.nodes, node)
+        self.index_add(node)
+
+    def leave(self, node):
+        self.index_remove(node)
+        remove_indexed(self.nodes, node)
+        if node.successor is not node:
+            # Only splice pointers that still refer to the leaving node
+            if node.predecessor is not None and node.predecessor.successor is node:
+                node.predecessor.set_successor(node.successor)
+            if node.successor.predecessor is node:
+                node.successor.predecessor = node.predecessor
+            node.successor.data.update(node.data)
+        node.data = Storage()
+        node.replica_data = Storage()
+        node.left = True  # Stale fingers pointing here are skipped
+
+    def crash(self, node):
+        # Leaves without telling anyone, its keys are lost
+        self.index_remove(node)
+        remove_indexed(self.nodes, node)
+        node.data = Storage()
+        node.replica_data = Storage()
+        node.left = True
+
+    def add_host(self, host):
+        append_indexed(self.hosts, host)
+        for v in range(self.vnodes):
+            node = Node(hash_id(f"{host.id}#{v}"), host, self.num_successors, self.cache_size)
+            host.vnodes.append(node)
+            self.join(node)
+
+    def remove_host(self, host, graceful=True):
+        remove_indexed(self.hosts, host)
+        for node in host.vnodes:
+            if graceful:
+                self.leave(node)
+            else:
+                self.crash(node)
+
+    def fail_host(self, host):
+        host.failed = True
+        for node in host.vnodes:
+            self.index_remove(node)
+
+    def recover_host(self, host):
+        host.failed = False
+        for node in host.vnodes:
+            self.index_add(node)
+
+    def stabilize_step(self):
+        # Every node stabilizes once per STABILIZE_INTERVAL steps on average, at a random phase
+        self.stabilize_credit += len(self.nodes) / STABILIZE_INTERVAL
+        while self.stabilize_credit >= 1:
+            self.stabilize_credit -= 1
+            node = random.choice(self.nodes)
+            if not node.failed:
+                node.check_predecessor()
+                node.stabilize()
+                node.check_successor(self.bootstrap_node())
+                node.fix_fingers()
+                if not node.joined:
+                    node.join(self.bootstrap_node())
+
+    def route_replicas(self, start_node, key_id):
+        # The owner of key_id followed by the successors holding its copies
+        if self.use_index:
+            if not self.ring_ids:
+                return []
+            position = bisect.bisect_left(self.ring_ids, key_id) % len(self.ring_ids)
+            return [self.ring_nodes[i] for i in self.replica_positions(position)]
+        cache = start_node.location_cache
+        if cache is not None and start_node.active:
+            owner, stale = start_node.cached_owner(key_id)
+            self.cache_invalidations += stale
+            if owner is not None:
+                # Cache hit, the owner is contacted directly without routing
+                self.total_lookups += 1
+                self.cache_hits += 1
+                if self.verify_routing and owner is not self.owner(key_id):
+                    self.routing_mismatches += 1
+                return distinct_hosts([owner] + owner.successor_list, self.replicas)
+        node, hops = start_node.find_predecessor(key_id)
+        self.total_lookups += 1
+        self.total_hops += hops
+        self.network_bytes += hops * ID_BYTES
+        target_node = node.successor if node else None
+        if self.verify_routing and target_node is not self.owner(key_id):
+            self.routing_mismatches += 1
+        if node is None:
+            return []
+        if cache is not None and target_node.active:
+            start_node.cache_owner(key_id, target_node)
+        return distinct_hosts([target_node] + node.successor_list, self.replicas)
+
+    def route(self, start_node, key_id):
+        replicas = self.route_replicas(start_node, key_id)
+        return replicas[0] if replicas else None
+
+    def replicate(self, replicas, items, message_bytes=None):
+        if message_bytes is None:
+            message_bytes = sum(KEY_BYTES + value_size(value) for _, value in items)
+        for replica in replicas:
+            replica.replica_data.update(items)
+            self.replication_messages += len(items)
+            self.replication_bytes += message_bytes
+            self.network_bytes += message_bytes
 
     def put(self, key, value):
         if not self.nodes:
@@ -51,10 +631,15 @@ class ChordRing:
         
         start_node = random.choice(self.nodes)
         start_time = time.time()
-        target_node = start_node.find_successor(key)
+        # The first live replica takes the write if the owner is down
+        replicas = [n for n in self.route_replicas(start_node, hash_id(key)) if not n.failed]
         
-        if target_node and not target_node.failed:
+        if replicas:
+            target_node = replicas[0]
             target_node.data[key] = value
+            target_node.host.requests_handled += 1
+            self.network_bytes += KEY_BYTES + value_size(value)
+            self.replicate(replicas[1:], [(key, value)])
             end_time = time.time()
             self.total_latency += (end_time - start_time) * 1000  # Convert to milliseconds
             return True
@@ -66,71 +651,244 @@ class ChordRing:
         
         start_node = random.choice(self.nodes)
         start_time = time.time()
-        target_node = start_node.find_successor(key)
+        replicas = self.route_replicas(start_node, hash_id(key))
         
-        if target_node and not target_node.failed:
-            value = target_node.data.get(key)
-            end_time = time.time()
-            self.total_latency += (end_time - start_time) * 1000  # Convert to milliseconds
-            return value
+        # Fall over to the next live replica if the owner is down or misses the key
+        for i, target_node in enumerate(replicas):
+            if target_node.failed:
+                continue
+            value = target_node.data.get(key, target_node.replica_data.get(key))
+            target_node.host.requests_handled += 1
+            self.network_bytes += KEY_BYTES
+            if value is not None:
+                self.network_bytes += value_size(value)
+                if i > 0:
+                    self.failover_reads += 1
+                end_time = time.time()
+                self.total_latency += (end_time - start_time) * 1000  # Convert to milliseconds
+                return value
         return None
 
-    def run_simulation(self, num_operations):
+    def put_many(self, keys, values):
+        keys = np.asarray(keys).tolist()
+        self.total_operations += len(keys)
+        if not self.ring_ids or len(keys) == 0:
+            return 0
+        values = np.asarray(values, dtype=object)
+        start_time = time.time()
+        message_bytes = KEY_BYTES + np.fromiter(map(value_size, values.tolist()), dtype=np.int64, count=len(values))
+        for position, indices in self.group_by_owner(keys):
+            owner, *replicas = [self.ring_nodes[i] for i in self.replica_positions(position)]
+            items = list(zip(map(keys.__getitem__, indices.tolist()), values[indices].tolist()))
+            owner.data.update(items)
+            owner.host.requests_handled += len(indices)
+            group_bytes = int(message_bytes[indices].sum())
+            self.network_bytes += group_bytes
+            self.replicate(replicas, items, group_bytes)
+        self.total_latency += (time.time() - start_time) * 1000  # Convert to milliseconds
+        self.successful_operations += len(keys)
+        return len(keys)
+
+    def get_many(self, keys):
+        keys = np.asarray(keys).tolist()
+        self.total_operations += len(keys)
+        results = np.full(len(keys), None, dtype=object)
+        if not self.ring_ids or len(keys) == 0:
+            return results
+        start_time = time.time()
+        for position, indices in self.group_by_owner(keys):
+            # The index owner is always live; it may hold the key as a replica after a takeover
+            node = self.ring_nodes[position]
+            data, replica_data = node.data, node.replica_data
+            found = [data.get(keys[i], replica_data.get(keys[i])) for i in indices]
+            results[indices] = found
+            node.host.requests_handled += len(indices)
+            self.network_bytes += KEY_BYTES * len(indices) + sum(value_size(value) for value in found if value is not None)
+        self.total_latency += (time.time() - start_time) * 1000  # Convert to milliseconds
+        self.successful_operations += sum(1 for value in results if value is not None)
+        return results
+
+    def random_key(self):
+        if self.key_weights is None:
+            return random.randint(0, 1000)
+        return random.choices(range(1001), cum_weights=self.key_weights)[0]
+
+    def run_simulation(self, num_operations, read_written=False):
+        # With read_written, gets only ask for keys that an earlier put stored
+        written = []
         for _ in range(num_operations):
             self.total_operations += 1
             
             # Simulate node failures and recoveries
-            for node in self.nodes:
-                if not node.failed and random.random() < FAILURE_RATE:
-                    node.failed = True
-                elif node.failed and random.random() < RECOVERY_RATE:
-                    node.failed = False
+            for host in self.hosts:
+                if not host.failed and random.random() < FAILURE_RATE:
+                    self.fail_host(host)
+                elif host.failed and random.random() < RECOVERY_RATE:
+                    self.recover_host(host)
+            if self.stabilize:
+                self.stabilize_step()
             
             # Perform operation
-            if random.random() < 0.5:  # 50% chance of put operation
-                key = random.randint(0, 1000)
+            if random.random() < 0.5 or (read_written and not written):  # 50% chance of put operation
+                key = self.random_key()
                 value = f"Value-{key}"
                 if self.put(key, value):
                     self.successful_operations += 1
+                    written.append(key)
             else:  # 50% chance of get operation
-                key = random.randint(0, 1000)
+                key = random.choice(written) if read_written else self.random_key()
+                self.gets += 1
                 if self.get(key) is not None:
+                    self.get_hits += 1
                     self.successful_operations += 1
 
+    def run_batched_simulation(self, num_operations, batch_size=BATCH_SIZE):
+        for _ in range(0, num_operations, batch_size):
+            # Failures and recoveries are sampled once per batch
+            for host in self.hosts:
+                if not host.failed and random.random() < FAILURE_RATE:
+                    self.fail_host(host)
+                elif host.failed and random.random() < RECOVERY_RATE:
+                    self.recover_host(host)
+            if self.stabilize:
+                self.stabilize_step()
+
+            keys = np.random.randint(0, 1001, size=batch_size)
+            puts = np.random.random(batch_size) < 0.5
+            self.put_many(keys[puts], [f"Value-{key}" for key in keys[puts].tolist()])
+            self.get_many(keys[~puts])
+
+    def run_churn_simulation(self, duration, arrival_rate=ARRIVAL_RATE, departure_rate=DEPARTURE_RATE):
+        for _ in range(duration):
+            for _ in range(np.random.poisson(arrival_rate)):
+                self.add_host(Host(self.next_host_id, f"Group{self.next_host_id % self.num_groups}"))
+                self.next_host_id += 1
+            for _ in range(np.random.poisson(departure_rate)):
+                if len(self.hosts) > 1:
+                    self.remove_host(random.choice(self.hosts), graceful=random.random() < GRACEFUL_LEAVE_PROBABILITY)
+            self.stabilize_step()
+
+            # A lookup succeeds if routing reaches the live node the index says owns the key
+            for _ in range(LOOKUPS_PER_STEP):
+                if not self.ring_nodes:
+                    break
+                key_id = random.getrandbits(BITS)
+                self.churn_lookups += 1
+                if self.route(random.choice(self.ring_nodes), key_id) is self.owner(key_id):
+                    self.churn_lookup_successes += 1
+
     def calculate_availability(self):
         if self.total_operations == 0:
             return 0
         return self.successful_operations / self.total_operations
 
     def calculate_availability_per_group(self):
-        group_availability = {f"Group{i}": {"total": 0, "available": 0} for i in range(NUM_GROUPS)}
-        for node in self.nodes:
-            group_availability[node.group]["total"] += 1
-            if not node.failed:
-                group_availability[node.group]["available"] += 1
+        group_availability = {f"Group{i}": {"total": 0, "available": 0} for i in range(self.num_groups)}
+        for host in self.hosts:
+            group_availability[host.group]["total"] += 1
+            if not host.failed:
+                group_availability[host.group]["available"] += 1
         
-        return {group: data["available"] / data["total"] for group, data in group_availability.items()}
+        # Churn can leave a group with no hosts
+        return {group: data["available"] / data["total"] for group, data in group_availability.items() if data["total"]}
+
+    def calculate_load_imbalance(self):
+        # Max/mean ratio and coefficient of variation of stored keys and requests per physical node
+        imbalance = {}
+        for metric, loads in (("keys", [h.stored_keys() for h in self.hosts]),
+                              ("requests", [h.requests_handled for h in self.hosts])):
+            mean = sum(loads) / len(loads) if loads else 0
+            if mean == 0:
+                imbalance[metric] = (0, 0)
+                continue
+            std = (sum((load - mean) ** 2 for load in loads) / len(loads)) ** 0.5
+            imbalance[metric] = (max(loads) / mean, std / mean)
+        return imbalance
+
+    def calculate_cache_stats(self):
+        # Hit ratio, hops saved per lookup compared with routed lookups, and cache memory in bytes
+        hit_ratio = self.cache_hits / self.total_lookups if self.total_lookups > 0 else 0
+        misses = self.total_lookups - self.cache_hits
+        hop_reduction = self.total_hops / misses - self.total_hops / self.total_lookups if misses > 0 else 0
+        memory = sum(sys.getsizeof(node.location_cache) + sum(sys.getsizeof(key) for key in node.location_cache)
+                     for node in self.nodes if node.location_cache is not None)
+        return hit_ratio, hop_reduction, memory
 
     def print_results(self):
         availability = self.calculate_availability()
         avg_latency = self.total_latency * 1000 / self.successful_operations if self.successful_operations > 0 else 0  # Convert to ms
         availability_per_group = self.calculate_availability_per_group()
+        avg_hops = self.total_hops / self.total_lookups if self.total_lookups > 0 else 0
+        imbalance = self.calculate_load_imbalance()
         
-        # Calculate network overhead
-        total_data_size = sum(len(str(key) + str(value)) for node in self.nodes for key, value in node.data.items())
-        avg_network_overhead = total_data_size / self.total_operations / (1024 * 1024) if self.total_operations > 0 else 0  # Convert to MB
+        avg_network_overhead = self.network_bytes / self.total_operations / (1024 * 1024) if self.total_operations > 0 else 0  # Convert to MB
         
         print(f"1. Average Latency: {avg_latency:.3f} ms")
         print(f"2. Overall Availability: {availability:.2%}")
         print(f"3. Availability per Group: {availability_per_group}")
         print(f"4. Average Network Overhead per Request: {avg_network_overhead:.6f} MB")
+        print(f"5. Average Lookup Hops: {avg_hops:.2f}")
+        print(f"6. Load Imbalance (max/mean, CV): keys {imbalance['keys'][0]:.2f}, {imbalance['keys'][1]:.2f}; "
+              f"requests {imbalance['requests'][0]:.2f}, {imbalance['requests'][1]:.2f}")
+        if self.verify_routing:
+            print(f"7. Routing Mismatches vs Index: {self.routing_mismatches}")
+        if self.churn_lookups > 0:
+            print(f"8. Lookup Success Rate under Churn: {self.churn_lookup_successes / self.churn_lookups:.2%}")
+        if self.replicas > 1:
+            print(f"9. Replication Messages per Request: {self.replication_messages / max(self.total_operations, 1):.2f}")
+            print(f"10. Failover Reads: {self.failover_reads}")
+        if self.cache_size > 0:
+            hit_ratio, hop_reduction, memory = self.calculate_cache_stats()
+            print(f"11. Location Cache Hit Ratio: {hit_ratio:.2%} ({self.cache_invalidations} stale entries dropped)")
+            print(f"12. Average Hop Reduction per Lookup: {hop_reduction:.2f}")
+            print(f"13. Location Cache Memory: {memory / 1024:.1f} KB")
+        stored_keys = sum(len(node.data) + len(node.replica_data) for node in self.nodes)
+        if stored_keys > 0:
+            # Each store also carries a fixed overhead for its empty containers, reported separately
+            store_overhead = Storage().memory()
+            storage_memory = sum(node.data.memory() + node.replica_data.memory() for node in self.nodes)
+            key_memory = storage_memory - 2 * len(self.nodes) * store_overhead
+            print(f"14. Storage Memory per Key: {key_memory / stored_keys:.1f} bytes, "
+                  f"plus {store_overhead} bytes per store")
         print(f"Successful Operations: {self.successful_operations}")
         print(f"Total Operations: {self.total_operations}")
 
+def replication_sweep(max_replicas=5):
+    # Availability/latency/overhead tradeoff for replication factors 1..max_replicas, reading only keys
+    # that were written so misses measure lost copies rather than keys never stored
+    for replicas in range(1, max_replicas + 1):
+        random.seed(0)
+        ring = ChordRing(NUM_NODES, NUM_GROUPS, replicas=replicas)
+        ring.run_simulation(NUM_OPERATIONS, read_written=True)
+        overhead = ring.network_bytes / ring.total_operations / (1024 * 1024)
+        latency = ring.total_latency / ring.successful_operations if ring.successful_operations > 0 else 0  # Already in ms
+        print(f"r={replicas}: Availability {ring.calculate_availability():.2%}, "
+              f"Read Availability {ring.get_hits / max(ring.gets, 1):.2%}, "
+              f"Latency {latency:.3f} ms, Overhead {overhead:.6f} MB")
+
+def churn_recovery(rates=(ARRIVAL_RATE, 0.5), duration=3000, quiet_steps=500):
+    # Lookup success while hosts join and leave at each rate, then after churn stops and the ring stabilizes
+    for rate in rates:
+        random.seed(0)
+        np.random.seed(0)
+        ring = ChordRing(NUM_NODES, NUM_GROUPS)
+        ring.run_churn_simulation(duration, rate, rate)
+        under_churn = ring.churn_lookup_successes / max(ring.churn_lookups, 1)
+        ring.churn_lookups = ring.churn_lookup_successes = 0
+        ring.run_churn_simulation(quiet_steps, 0, 0)
+        recovered = ring.churn_lookup_successes / max(ring.churn_lookups, 1)
+        unjoined = sum(1 for node in ring.nodes if not node.joined)
+        print(f"Churn {rate}/step: {under_churn:.2%} lookups succeed under churn, "
+              f"{recovered:.2%} over the next {quiet_steps} quiet steps ({unjoined}/{len(ring.nodes)} vnodes unjoined)")
+
 if __name__ == "__main__":
     chord_ring = ChordRing(NUM_NODES, NUM_GROUPS)
     chord_ring.run_simulation(NUM_OPERATIONS)
     chord_ring.print_results()
+    # Sweeps only run with --benchmarks
+    if "--benchmarks" in sys.argv:
+        churn_recovery()
+        replication_sweep()
 
 
 '''import random
@@ -1,21 +1,242 @@
 import simpy
 import random
+import sys
+import time
+
+import numpy as np
 
 # Constants
 NUM_NODES = 100
 NUM_CLIENT_REQUESTS = 10000
+VIEW_SIZE = 0  # Peers per partial view (about log2 N); 0 keeps a full membership view
+EXCLUDE_FAILED = True  # Only sample peers that are up
+SHUFFLE_INTERVAL = 10  # Gossip cycles between view shuffles
+SHUFFLE_LENGTH = 3  # View entries swapped per shuffle
+DIGEST_ENTRY_BYTES = 12  # Origin id and sequence number in a version-vector digest
+UPDATE_BYTES = 76  # Update id plus a 64-byte value
+GOSSIP_MODE = "pull"  # "push", "pull" (digest anti-entropy) or "push-pull"
+FANOUT = 1  # Peers contacted per gossip cycle
+GOSSIP_INTERVAL = 1  # Time units between gossip cycles
+WRITE_RATE = 0.1  # Updates injected per time unit, each at a random live node
+RUMOR_STOP = 4  # Pushes that find the peer already has a rumor before it goes cold
+CONVERGENCE_TIME = 200  # Writes are injected for this long, then the sweep drains for DRAIN_TIME
+DRAIN_TIME = 50
+FAILURE_PROB = 0.001  # Per-cycle chance a live node fails
+RECOVERY_PROB = 0.01  # Per-cycle chance a failed node recovers
+ROUND_UPDATES = 64  # Updates tracked by the round engine, one bit each in a uint64 per node
+
+class Membership:
+    # Members and live members are kept in lists with each node's position, so sampling is a
+    # random index and a failure or recovery is a swap-remove or append
+    def __init__(self, view_size=VIEW_SIZE, exclude_failed=EXCLUDE_FAILED):
+        self.members = []
+        self.live = []
+        self.view_size = view_size
+        self.exclude_failed = exclude_failed
+
+    def add(self, node):
+        self.members.append(node)
+        self.mark_live(node)
+
+    def mark_live(self, node):
+        node.live_slot = len(self.live)
+        self.live.append(node)
+
+    def mark_failed(self, node):
+        last = self.live.pop()
+        if last is not node:
+            self.live[node.live_slot] = last
+            last.live_slot = node.live_slot
+        node.live_slot = None
+
+    def random_member(self, node):
+        pool = self.live if self.exclude_failed else self.members
+        in_pool = pool is self.members or node.live_slot is not None
+        if len(pool) - in_pool < 1:
+            return None
+        while True:
+            peer = pool[random.randrange(len(pool))]
+            if peer is not node:
+                return peer
+
+    def init_views(self):
+        # Each node starts with a random partial view of view_size peers
+        for node in self.members:
+            node.view = []
+            while len(node.view) < min(self.view_size, len(self.members) - 1):
+                peer = self.members[random.randrange(len(self.members))]
+                if peer is not node and peer not in node.view:
+                    node.view.append(peer)
+
+    def sample(self, node):
+        if not self.view_size:
+            return self.random_member(node)
+        for _ in range(len(node.view)):
+            peer = node.view[random.randrange(len(node.view))]
+            if not (self.exclude_failed and peer.failed):
+                return peer
+        # Every neighbour looks down; rejoin through a random live member
+        peer = self.random_member(node)
+        if peer is not None:
+            node.view[random.randrange(len(node.view))] = peer
+        return peer
+
+    def shuffle(self, node):
+        # Cyclon-style: swap a few view entries with a neighbour; entries for failed peers are dropped
+        peer = self.sample(node)
+        if peer is None:
+            return
+        sent = random.sample(node.view, min(SHUFFLE_LENGTH - 1, len(node.view))) + [node]
+        received = random.sample(peer.view, min(SHUFFLE_LENGTH, len(peer.view)))
+        self.merge(peer, sent, received)
+        self.merge(node, received, sent)
+
+    def merge(self, node, incoming, outgoing):
+        view = [p for p in node.view if p not in outgoing and not p.failed]
+        for p in incoming:
+            if len(view) < self.view_size and p is not node and p not in view:
+                view.append(p)
+        for p in outgoing:
+            if len(view) < self.view_size and p is not node and p not in view and not p.failed:
+                view.append(p)
+        node.view = view
+
+class ConvergenceTracker:
+    # Time from an update's creation until it is held by 50%, 99% and 100% of the nodes live at that moment
+    FRACTIONS = (0.5, 0.99, 1.0)
+
+    def __init__(self, env, membership):
+        self.env = env
+        self.membership = membership
+        self.created = {}
+        self.holders = {}  # Update -> live nodes holding it
+        self.reached = {}
+        self.pending = set()  # Updates not yet on every live node
+
+    def record(self, update, node):
+        if update not in self.created:
+            self.created[update] = self.env.now
+            self.holders[update] = 0
+            self.reached[update] = [None] * len(self.FRACTIONS)
+            self.pending.add(update)
+        if not node.failed:
+            self.holders[update] += 1
+            self.check(update)
+
+    def node_failed(self, node):
+        for update in node.data:
+            self.holders[update] -= 1
+        # A node that was missing updates going down can complete them
+        for update in list(self.pending):
+            self.check(update)
+
+    def node_recovered(self, node):
+        for update in node.data:
+            self.holders[update] += 1
+
+    def check(self, update):
+        reached = self.reached[update]
+        live = len(self.membership.live)
+        for i, fraction in enumerate(self.FRACTIONS):
+            if reached[i] is None and self.holders[update] >= fraction * live:
+                reached[i] = self.env.now - self.created[update]
+        if reached[-1] is not None:
+            self.pending.discard(update)
+
+    def summary(self):
+        # Mean time to each fraction over the updates that reached every live node, and how many did
+        complete = [reached for reached in self.reached.values() if reached[-1] is not None]
+        if not complete:
+            return [float("inf")] * len(self.FRACTIONS), 0
+        return [sum(reached[i] for reached in complete) / len(complete) for i in range(len(self.FRACTIONS))], len(complete)
+
+def writer(env, membership, rate=WRITE_RATE, stop=None):
+    while True:
+        yield env.timeout(random.expovariate(rate))
+        if stop is not None and env.now > stop:
+            return
+        if membership.live:
+            membership.live[random.randrange(len(membership.live))].write()
 
 class EpidemicReplication:
-    def __init__(self, env, id):
+    def __init__(self, env, id, membership, tracker=None, mode=GOSSIP_MODE, fanout=FANOUT,
+                 gossip_interval=GOSSIP_INTERVAL):
         self.env = env
         self.id = id
-        self.data = set()
+        self.membership = membership
+        self.tracker = tracker
+        self.mode = mode
+        self.fanout = fanout
+        self.gossip_interval = gossip_interval
+        self.next_seq = 0
+        self.hot = {}  # Rumors still being pushed -> pushes left before they go cold
+        self.view = []
+        self.live_slot = None
+        self.data = set()  # Update ids, (origin, seq)
+        self.versions = {}  # Origin -> highest seq held with no gaps before it
+        self.extra = set()  # Updates held past a gap in their origin's sequence
         self.latency = []
         self.network_overhead = 0
         self.requests_handled = 0
         self.failed = False
+        self.cycles = 0
+        membership.add(self)
         self.env.process(self.run())
 
+    def add(self, origin, seq):
+        if (origin, seq) in self.data:
+            return False
+        self.data.add((origin, seq))
+        if self.mode != "pull":
+            self.hot[(origin, seq)] = RUMOR_STOP
+        if self.tracker is not None:
+            self.tracker.record((origin, seq), self)
+        if seq == self.versions.get(origin, -1) + 1:
+            self.versions[origin] = seq
+            while (origin, seq + 1) in self.extra:
+                seq += 1
+                self.extra.discard((origin, seq))
+                self.versions[origin] = seq
+        else:
+            self.extra.add((origin, seq))
+        return True
+
+    def write(self):
+        self.add(self.id, self.next_seq)
+        self.next_seq += 1
+
+    def push(self, other_node):
+        # Rumor mongering: send every hot rumor; each one the peer already had cools a little
+        if not self.hot:
+            return
+        self.network_overhead += len(self.hot) * UPDATE_BYTES
+        for update in list(self.hot):
+            if not other_node.add(*update):
+                self.hot[update] -= 1
+                if self.hot[update] <= 0:
+                    del self.hot[update]
+
+    def digest_bytes(self):
+        return (len(self.versions) + len(self.extra)) * DIGEST_ENTRY_BYTES
+
+    def missing_from(self, versions, extra):
+        # Everything this node holds that a peer with the given digest lacks; the work is per
+        # origin and per missing update, not per update held
+        missing = []
+        for origin, seq in self.versions.items():
+            for missing_seq in range(versions.get(origin, -1) + 1, seq + 1):
+                if (origin, missing_seq) not in extra:
+                    missing.append((origin, missing_seq))
+        missing.extend(item for item in self.extra if item not in extra and item[1] > versions.get(item[0], -1))
+        return missing
+
+    def anti_entropy(self, other_node):
+        # Send a version-vector digest and receive only the updates it shows are missing
+        delta = other_node.missing_from(self.versions, self.extra)
+        self.network_overhead += self.digest_bytes() + len(delta) * UPDATE_BYTES
+        for origin, seq in delta:
+            self.add(origin, seq)
+
     def run(self):
         while True:
             if not self.failed:
@@ -27,44 +248,262 @@ class EpidemicReplication:
                     self.latency.append(self.env.now - start_time)
                     self.requests_handled += 1
 
-                # Gossip with random node
-                other_node = random.choice([n for n in nodes if n != self])
-                network_overhead = random.uniform(0.1, 1.0)
-                self.network_overhead += network_overhead
-                yield self.env.timeout(network_overhead)
+                # Gossip with fanout random nodes
+                peers = [self.membership.sample(self) for _ in range(self.fanout)]
+                yield self.env.timeout(random.uniform(0.1, 1.0))  # Network delay
+
+                for other_node in peers:
+                    if other_node is None or other_node.failed:
+                        continue
+                    if self.mode != "pull":
+                        self.push(other_node)
+                    if self.mode != "push":
+                        self.anti_entropy(other_node)
 
-                # Simulate data exchange
-                new_data = other_node.data - self.data
-                self.data.update(new_data)
+                self.cycles += 1
+                if self.membership.view_size and self.cycles % SHUFFLE_INTERVAL == 0:
+                    self.membership.shuffle(self)
 
             # Simulate node failure/recovery
-            if random.random() < 0.001:  # 0.1% chance of failure
-                self.failed = True
-            elif self.failed and random.random() < 0.01:  # 1% chance of recovery if failed
+            if random.random() < FAILURE_PROB:
+                if not self.failed:
+                    self.failed = True
+                    self.membership.mark_failed(self)
+                    if self.tracker is not None:
+                        self.tracker.node_failed(self)
+            elif self.failed and random.random() < RECOVERY_PROB:
                 self.failed = False
+                self.membership.mark_live(self)
+                if self.tracker is not None:
+                    self.tracker.node_recovered(self)
+
+            yield self.env.timeout(self.gossip_interval)  # Wait before next cycle
+
+class RoundGossip:
+    # Round-synchronous engine: every live node gossips once per round, all of them at once as array
+    # operations. Each node's updates are a bitset in one uint64; peers are drawn uniformly from the
+    # live nodes (a full view with EXCLUDE_FAILED).
+    def __init__(self, num_nodes, mode=GOSSIP_MODE, fanout=FANOUT, num_updates=ROUND_UPDATES, failures=True):
+        if num_updates > ROUND_UPDATES:
+            raise ValueError(f"RoundGossip tracks at most {ROUND_UPDATES} updates, one bit each in a uint64 per node")
+        self.num_nodes = num_nodes
+        self.mode = mode
+        self.fanout = fanout
+        self.failures = failures
+        self.have = np.zeros(num_nodes, dtype=np.uint64)
+        self.hot = np.zeros((num_nodes, num_updates), dtype=np.uint8)  # Pushes left per rumor
+        self.live = np.ones(num_nodes, dtype=bool)
+        self.bits = np.uint64(1) << np.arange(num_updates, dtype=np.uint64)
+        self.round = 0
+        self.updates = 0
+        self.created = np.zeros(num_updates, dtype=np.int64)
+        self.origins = {}  # Origin -> bits of every update it wrote
+        self.prefixes = np.zeros(0, dtype=np.uint64)  # Each origin's first 2, 3, ... updates, one mask each
+        self.reached = np.full((num_updates, len(ConvergenceTracker.FRACTIONS)), -1, dtype=np.int64)
+        self.network_overhead = 0
+
+    def write(self):
+        if self.updates == len(self.bits):
+            raise ValueError(f"All {len(self.bits)} updates are already written; raise num_updates")
+        live = np.flatnonzero(self.live)
+        node = live[np.random.randint(len(live))]
+        update = self.updates
+        self.updates += 1
+        self.have[node] |= self.bits[update]
+        if node in self.origins:
+            self.origins[node] |= self.bits[update]
+            self.prefixes = np.append(self.prefixes, self.origins[node])
+        else:
+            self.origins[node] = self.bits[update]
+        if self.mode != "pull":
+            self.hot[node, update] = RUMOR_STOP
+        self.created[update] = self.round
+
+    def unpack(self, words):
+        return (words[:, None] & self.bits) != 0
+
+    def digest_entries(self, words):
+        # As in the simpy mode: one entry per origin for its gap-free run of updates, plus one per
+        # update held past a gap. Every run prefix after an origin's first update saves an entry.
+        entries = int(np.bitwise_count(words).sum())
+        if len(self.prefixes):
+            entries -= int(np.count_nonzero((words[:, None] & self.prefixes) == self.prefixes))
+        return entries
+
+    def step(self):
+        live = np.flatnonzero(self.live)
+        before = self.have.copy()
+        for _ in range(self.fanout):
+            peers = live[np.random.randint(len(live), size=len(live))]
+            contact = peers != live
+            senders, peers = live[contact], peers[contact]
+            if self.mode != "pull":
+                # Push every hot rumor; the ones the peer already had cool down at the sender
+                sent = np.bitwise_or.reduce(np.where(self.hot[senders] > 0, self.bits, np.uint64(0)), axis=1)
+                duplicate = sent & self.have[peers]
+                np.bitwise_or.at(self.have, peers, sent)
+                # Only the first sender to reach a peer with a rumor finds it new, as if the pushes
+                # arrived one after another
+                pushing = np.flatnonzero(sent)
+                order = pushing[np.argsort(peers[pushing], kind="stable")]
+                sent_sorted = sent[order]
+                for bit in self.bits[:self.updates]:
+                    carriers = order[(sent_sorted & bit) != 0]
+                    repeat = peers[carriers[1:]] == peers[carriers[:-1]]
+                    duplicate[carriers[1:][repeat]] |= bit
+                self.hot[senders] -= self.unpack(duplicate) & (self.hot[senders] > 0)
+                self.network_overhead += int(np.bitwise_count(sent).sum()) * UPDATE_BYTES
+            if self.mode != "push":
+                # Pull: send a digest, get back whatever the peer held at the start of the round
+                missing = before[peers] & ~before[senders]
+                self.have[senders] |= missing
+                self.network_overhead += (self.digest_entries(before[senders]) * DIGEST_ENTRY_BYTES
+                                          + int(np.bitwise_count(missing).sum()) * UPDATE_BYTES)
+        if self.mode != "pull":
+            infected = np.flatnonzero(self.have != before)
+            fresh = self.unpack(self.have[infected] & ~before[infected])
+            self.hot[infected] = np.where(fresh, RUMOR_STOP, self.hot[infected])
+
+        if self.failures:
+            # Failures and recoveries, drawn per node as in the simpy mode
+            draws = np.random.random(self.num_nodes)
+            recover = ~self.live & (draws >= FAILURE_PROB) & (np.random.random(self.num_nodes) < RECOVERY_PROB)
+            self.live &= draws >= FAILURE_PROB
+            self.live |= recover
+        self.round += 1
+        self.track()
+
+    def track(self):
+        live_have = self.have[self.live]
+        live = len(live_have)
+        for update in range(self.updates):
+            reached = self.reached[update]
+            if reached[-1] >= 0:
+                continue
+            holders = np.count_nonzero(live_have & self.bits[update])
+            for i, fraction in enumerate(ConvergenceTracker.FRACTIONS):
+                if reached[i] < 0 and holders >= fraction * live:
+                    reached[i] = self.round - self.created[update]
+
+    def summary(self):
+        # Same shape as ConvergenceTracker.summary
+        complete = self.reached[:self.updates]
+        complete = complete[complete[:, -1] >= 0]
+        if not len(complete):
+            return [float("inf")] * len(ConvergenceTracker.FRACTIONS), 0
+        return complete.mean(axis=0).tolist(), len(complete)
+
+def run_rounds(num_nodes, mode=GOSSIP_MODE, fanout=FANOUT, num_updates=ROUND_UPDATES, rounds=100, failures=True):
+    # One write per round at a random live node until num_updates are out, then drain
+    np.random.seed(0)
+    engine = RoundGossip(num_nodes, mode, fanout, num_updates, failures)
+    for _ in range(rounds):
+        if engine.updates < num_updates:
+            engine.write()
+        engine.step()
+    return engine
+
+def validate_round_engine(modes=("push", "pull", "push-pull"), fanouts=(1, 2), num_nodes=500):
+    # Convergence in gossip cycles: simpy time is divided by the measured mean cycle length
+    print("Mode       Fanout  simpy t50/t99/t100 (cycles)  rounds t50/t99/t100")
+    for mode in modes:
+        for fanout in fanouts:
+            random.seed(0)
+            sim_env = simpy.Environment()
+            sim_membership = Membership()
+            tracker = ConvergenceTracker(sim_env, sim_membership)
+            sim_nodes = [EpidemicReplication(sim_env, i, sim_membership, tracker, mode, fanout)
+                         for i in range(num_nodes)]
+            sim_env.process(writer(sim_env, sim_membership, stop=CONVERGENCE_TIME))
+            sim_env.run(until=CONVERGENCE_TIME + DRAIN_TIME)
+            cycle_time = sim_env.now * num_nodes / sum(node.cycles for node in sim_nodes)
+            simulated = [t / cycle_time for t in tracker.summary()[0]]
+            rounds = run_rounds(num_nodes, mode, fanout).summary()[0]
+            print(f"{mode:9s}  {fanout:6d}  {simulated[0]:6.1f} {simulated[1]:6.1f} {simulated[2]:6.1f}"
+                  f"         {rounds[0]:6.1f} {rounds[1]:6.1f} {rounds[2]:6.1f}")
+
+def round_benchmark(node_counts=(1000, 100000, 1000000), mode="push-pull", fanout=1, num_updates=8, rounds=40):
+    # Without churn, so that 100% of live nodes stays reachable at a million nodes
+    for num_nodes in node_counts:
+        started = time.perf_counter()
+        engine = run_rounds(num_nodes, mode, fanout, num_updates, rounds, failures=False)
+        elapsed = time.perf_counter() - started
+        (t50, t99, t100), complete = engine.summary()
+        print(f"{num_nodes} nodes, {mode} fanout {fanout}: {elapsed / rounds * 1e3:.1f} ms per round, "
+              f"t50/t99/t100 {t50:.1f}/{t99:.1f}/{t100:.1f} rounds ({complete}/{engine.updates} complete), "
+              f"{engine.network_overhead / engine.updates / 1024 ** 2:.1f} MB per update")
+
+def scaling_benchmark(node_counts=(1000, 10000, 100000), until=5):
+    # Wall-clock cost per gossip as the membership grows, with full and partial views
+    for num_nodes in node_counts:
+        for view_size in (0, max(1, num_nodes.bit_length())):
+            random.seed(0)
+            bench_env = simpy.Environment()
+            membership = Membership(view_size)
+            bench_nodes = [EpidemicReplication(bench_env, i, membership) for i in range(num_nodes)]
+            if view_size:
+                membership.init_views()
+            started = time.perf_counter()
+            bench_env.run(until=until)
+            elapsed = time.perf_counter() - started
+            gossips = num_nodes * until
+            print(f"{num_nodes} nodes, {'partial view of ' + str(view_size) if view_size else 'full view'}: "
+                  f"{elapsed / gossips * 1e6:.2f} us per gossip cycle")
+
+def convergence_sweep(modes=("push", "pull", "push-pull"), fanouts=(1, 2, 4), intervals=(1, 2), num_nodes=500):
+    print("Mode       Fanout  Interval  t50     t99     t100    Complete  KB per Update")
+    for mode in modes:
+        for fanout in fanouts:
+            for interval in intervals:
+                random.seed(0)
+                sweep_env = simpy.Environment()
+                sweep_membership = Membership()
+                tracker = ConvergenceTracker(sweep_env, sweep_membership)
+                sweep_nodes = [EpidemicReplication(sweep_env, i, sweep_membership, tracker, mode, fanout, interval)
+                               for i in range(num_nodes)]
+                sweep_env.process(writer(sweep_env, sweep_membership, stop=CONVERGENCE_TIME))
+                sweep_env.run(until=CONVERGENCE_TIME + DRAIN_TIME)
+                (t50, t99, t100), complete = tracker.summary()
+                updates = max(len(tracker.created), 1)
+                kilobytes = sum(node.network_overhead for node in sweep_nodes) / updates / 1024
+                print(f"{mode:9s}  {fanout:6d}  {interval:8d}  {t50:6.1f}  {t99:6.1f}  {t100:6.1f}  "
+                      f"{complete / updates:8.0%}  {kilobytes:13.1f}")
 
-            yield self.env.timeout(1)  # Wait for 1 time unit before next cycle
+if __name__ == "__main__":
+    # Simulation
+    env = simpy.Environment()
+    membership = Membership()
+    tracker = ConvergenceTracker(env, membership)
+    nodes = [EpidemicReplication(env, i, membership, tracker) for i in range(NUM_NODES)]
+    if membership.view_size:
+        membership.init_views()
+    env.process(writer(env, membership))
+    env.run(until=NUM_CLIENT_REQUESTS)
 
-# Simulation    
-env = simpy.Environment()
-nodes = [EpidemicReplication(env, i) for i in range(NUM_NODES)]
-env.run(until=NUM_CLIENT_REQUESTS)
+    # Calculate statistics
+    total_latency = sum(sum(node.latency) for node in nodes)
+    total_requests = sum(node.requests_handled for node in nodes)
+    average_latency = total_latency / total_requests if total_requests > 0 else 0
 
-# Calculate statistics
-total_latency = sum(sum(node.latency) for node in nodes)
-total_requests = sum(node.requests_handled for node in nodes)
-average_latency = total_latency / total_requests if total_requests > 0 else 0
+    total_network_overhead = sum(node.network_overhead for node in nodes)  # Bytes
+    average_network_overhead = total_network_overhead / NUM_CLIENT_REQUESTS / (1024 * 1024)
 
-total_network_overhead = sum(node.network_overhead for node in nodes)
-average_network_overhead = total_network_overhead / NUM_CLIENT_REQUESTS
+    # Calculate availability
+    overall_availability = sum(1 for node in nodes if not node.failed) / NUM_NODES
 
-# Calculate availability
-overall_availability = sum(1 for node in nodes if not node.failed) / NUM_NODES
+    # Calculate availability per node (as we don't have explicit groups in Epidemic Replication)
+    availability_per_node = [node.requests_handled / NUM_CLIENT_REQUESTS for node in nodes]
 
-# Calculate availability per node (as we don't have explicit groups in Epidemic Replication)
-availability_per_node = [node.requests_handled / NUM_CLIENT_REQUESTS for node in nodes]
+    print(f"1. Average Latency: {average_latency:.3f} ms")
+    print(f"2. Overall Availability: {overall_availability:.2%}")
+    print(f"3. Availability per Node (first 10 nodes): {[f'{a:.2%}' for a in availability_per_node[:10]]}")
+    print(f"4. Average Network Overhead per Request: {average_network_overhead:.6f} MB")
+    (t50, t99, t100), _ = tracker.summary()
+    print(f"5. Convergence Time (50%/99%/100% of live nodes): {t50:.2f} / {t99:.2f} / {t100:.2f}")
 
-print(f"1. Average Latency: {average_latency:.3f} ms")
-print(f"2. Overall Availability: {overall_availability:.2%}")
-print(f"3. Availability per Node (first 10 nodes): {[f'{a:.2%}' for a in availability_per_node[:10]]}")
-print(f"4. Average Network Overhead per Request: {average_network_overhead/100:.6f} MB")
\ No newline at end of file
+    # The sweeps and benchmarks take about a minute, so they only run with --benchmarks
+    if "--benchmarks" in sys.argv:
+        scaling_benchmark()
+        convergence_sweep()
+        validate_round_engine()
+        round_benchmark()
@@ -0,0 +1,34 @@
+import random
+
+# Shared by the chain replication and primary-backup simulations
+SERVICE_DISTRIBUTION = "exponential"  # "constant", "exponential" or "uniform" (0.5x to 1.5x the mean)
+
+def service_time(mean):
+    if SERVICE_DISTRIBUTION == "exponential":
+        return random.expovariate(1 / mean)
+    if SERVICE_DISTRIBUTION == "uniform":
+        return random.uniform(0.5 * mean, 1.5 * mean)
+    return mean
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+def saturation_sweep(offered_loads, run, unit):
+    # run(offered_load) returns the completed latencies and the ms simulated. Saturation is the highest
+    # throughput reached; the knee is the first load where p99 latency is more than double its light-load value.
+    print("Offered  Throughput  p50 (ms)  p99 (ms)")
+    baseline = None
+    knee = None
+    saturation = 0
+    for offered_load in offered_loads:
+        random.seed(0)
+        latencies, elapsed = run(offered_load)
+        throughput = len(latencies) / elapsed
+        p99 = percentile(latencies, 0.99)
+        baseline = baseline or p99
+        if knee is None and p99 > 2 * baseline:
+            knee = offered_load
+        saturation = max(saturation, throughput)
+        print(f"{offered_load:7.1f}  {throughput:10.2f}  {percentile(latencies, 0.5):8.2f}  {p99:8.2f}")
+    print(f"Saturation throughput: {saturation:.2f} {unit}/ms, latency knee at {knee} {unit}/ms offered")
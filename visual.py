@@ -3,7 +3,7 @@ import numpy as np
 
 # Data
 algorithms = ['Chain', 'Chord', 'Epidemic', 'Paxos', 'Primary-Backup']
-latencies = [5.425, 0.000897, 5.507, 0.001, 11.44]  # in ms
+latencies = [5.425, 0.000897, 5.507, 21.669, 11.44]  # in ms (Paxos from the discrete-event engine)
 availabilities = [0.531, 33.00, 94.000, 8.00, 90.23]  # in %
 overheads = [0.101, 0.002928, 25.112, 0, 61.295]  # in MB
 